@@ -1,35 +1,76 @@
 import logging
 import asyncio
+from collections import Counter, deque
 try:
     from asyncio import run
 except ImportError:
     from ._asyncio_compat import run  # noqa
+try:
+    from asyncio import BufferedProtocol as _BaseProtocol
+except ImportError:
+    # Python < 3.7, received data is copied into the receive buffer.
+    from asyncio import Protocol as _BaseProtocol
 
-from async_generator import async_generator, yield_
+from async_generator import async_generator, yield_, asynccontextmanager
 
 from ..connection import Connection
 from ..channel import Channel, BaseChannel
-from ..replies import Reply, AsynchronousReply, ConnectionAborted
-from ..methods import BasicDeliver, BasicReturn, ChannelClose, ConnectionClose
+from ..replies import (
+    Reply, AsynchronousReply, ConnectionAborted, ChannelError,
+    MessageNacked, MessageReturned,
+)
+from ..methods import (
+    BasicDeliver, BasicReturn, ChannelOpen, ChannelClose, ConnectionOpen,
+)
 
 
 class AsyncioBaseChannel(BaseChannel):
+    """
+    :param response_timeout: how many seconds to wait for responses
+        to synchronous methods, forever by default. Can be changed
+        between calls, or use ``asyncio.wait_for`` for a single call.
+    """
 
-    def __init__(self, writer, write_limit=50, *args, **kwargs):
+    def __init__(self, writer, *args, response_timeout=None, budget=None,
+                 **kwargs):
         super().__init__(*args, **kwargs)
         self._writer = writer
+        self.response_timeout = response_timeout
+        # The connection's _DeliveryBudget.
+        self._budget = budget
         # The server can send us two things: a response to a method or
-        # a connection/channel exception.
-        self._response = asyncio.Queue(maxsize=1)
-        self._server_exception = asyncio.Queue(maxsize=1)
-        # A client exception can also happen in
-        # AsyncioConnection._communicate.
-        self._client_exception = asyncio.Queue(maxsize=1)
-
-        self._write_limit = write_limit
-        self._wrote_without_response = 0
+        # a connection/channel exception. The server responds in order,
+        # so futures of methods waiting for responses are resolved
+        # first in first out. An exception fails all of them.
+        self._responses = deque()
+        self._exception = None
+        # Mapping (task -> futures of methods sent inside its pipeline()
+        # block), other tasks keep waiting for their responses.
+        self._pipelined = {}
 
     async def _prepare_for_sending(self, method):
+        response = self._send(method)
+        if response is None:
+            # If there's no response we cant wait for, we should only
+            # drain for I/O to complete. Possible error handling
+            # is deferred to the next await, as described below.
+            # Drain only waits while the transport write buffer is above
+            # the high watermark, and makes sure the event loop runs
+            # regularly (see _CoalescingWriter).
+            await self._writer.drain()
+            return
+        # If there is a response, then we can handle possible errors
+        # right here, yay!
+        pipelined = self._pipelined.get(_current_task())
+        if pipelined is not None:
+            pipelined.append(response)
+            return response
+        return await self._wait(response)
+
+    def _send(self, method):
+        """Send the method without waiting, return a future of its response
+        or ``None`` if it has no response.
+        """
         # Because of asynchronous nature of AMQP, error handling
         # is difficult. First, we can't know in advance
         # the exact moment in future when the broker decides to send
@@ -47,51 +88,94 @@ class AsyncioBaseChannel(BaseChannel):
             # Raising the exception from the second call is at least
             # confusing, but I don't know a better way to inform
             # the user about the error.
-            exc = await self._server_exception.get()
-            raise AsynchronousReply(exc)
+            if self._exception is None:
+                raise ChannelError('channel is {}'.format(self.state))
+            raise AsynchronousReply(self._exception)
         logging.info('[channel_id %s] sending %s', self.channel_id, method)
         super()._prepare_for_sending(method)
-        self._writer.write(self.data_to_send())
+        self._writer.writelines(self.segments_to_send())
         if not method.has_response():
-            # If there's no response we cant wait for, we should only
-            # drain for I/O to complete. Possible error handling
-            # is deferred to the next await, as described above.
-            await self._writer.drain()
+            return None
+        response = asyncio.get_event_loop().create_future()
+        self._responses.append((method, response))
+        if self._budget is not None:
+            # Receiving can't stay paused, the response must be read.
+            self._budget.wake()
+        return response
+
+    def _responses_pending(self):
+        return bool(self._responses)
+
+    @asynccontextmanager
+    @async_generator
+    async def pipeline(self):
+        """Send synchronous methods without waiting for their responses.
+        Inside the block, awaiting a method only sends it and returns
+        a future of the response. All responses are awaited on exit,
+        the first error is raised::
+
+            async with channel.pipeline():
+                for name in names:
+                    await channel.queue_declare(name)
+                    await channel.queue_bind(name, 'exchange', name)
 
-            # On a non-paused connection, drain won't yield to the event loop
-            # making it impossible for _communicate to ever run.
-            # We fix this by introducing a limit of writes without
-            # awaiting for a reply (basic_publish case). Once the limit is hit,
-            # we explicitly yield to the event loop via asyncio.sleep(0).
-            #
-            # Yes, we could sleep after every single drain but that is
-            # _very_ inefficient.
-
-            self._wrote_without_response += 1
-            if self._wrote_without_response > self._write_limit:
-                await asyncio.sleep(0)
-                self._wrote_without_response = 0
+        Only methods awaited by the task that entered the block are
+        pipelined, methods awaited by other tasks return their responses
+        as usual. Concurrent calls, e.g. with ``asyncio.gather``, are
+        pipelined as well, even outside of the block.
+        """
+        task = _current_task()
+        if task in self._pipelined:
+            raise RuntimeError('the task is already pipelining')
+        self._pipelined[task] = pipelined = []
+        try:
+            await yield_(self)
+        finally:
+            del self._pipelined[task]
+        await self._wait_all(pipelined)
+
+    async def _wait_all(self, futures, shield=False):
+        # Unlike plain gather, retrieve all exceptions before raising
+        # the first one. Shielded futures aren't cancelled on timeout.
+        if not futures:
             return
-        self._wrote_without_response = 0
-        # If there is a response, then we can handle possible errors
-        # right here, yay!
-        return await self._result_or_exception(self._response.get())
-
-    async def _result_or_exception(self, coro=None):
-        fs = [self._client_exception.get(), self._server_exception.get()]
-        if coro is not None:
-            fs.append(coro)
-        done, pending = await asyncio.wait(
-            fs, timeout=2, return_when=asyncio.FIRST_COMPLETED
-        )
-        for task in pending:
-            task.cancel()
-        response = None
-        for task in done:
-            response = await task
-            if isinstance(response, Exception):
-                raise response
-        return response
+        gathered = asyncio.gather(*futures, return_exceptions=True)
+        if shield:
+            gathered = asyncio.shield(gathered)
+        results = await self._wait(gathered)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def _wait(self, future):
+        if self.response_timeout is None:
+            return await future
+        # On timeout the future is cancelled, its response is dropped.
+        return await asyncio.wait_for(future, self.response_timeout)
+
+    def _fail(self, exc):
+        """Close the channel with the exception, failing all methods
+        waiting for responses.
+        """
+        self.state = 'closed'
+        self._exception = exc
+        responses, self._responses = self._responses, deque()
+        # The server stops processing methods at the failed one, which
+        # is the oldest method waiting for a response that the exception
+        # names. It gets the exception, the methods sent after it were
+        # never processed and get AsynchronousReply.
+        culprit = next((
+            response for method, response in responses
+            if (method.class_id, method.method_id) ==
+            (getattr(exc, 'class_id', 0), getattr(exc, 'method_id', 0))
+        ), None)
+        for _, response in responses:
+            if response.done():
+                continue
+            if culprit is None or response is culprit:
+                response.set_exception(exc)
+            else:
+                response.set_exception(AsynchronousReply(exc))
 
     async def _receive_method(self, method):
         logging.info('[channel_id %s] receiving %s', self.channel_id, method)
@@ -101,17 +185,14 @@ class AsyncioBaseChannel(BaseChannel):
             fut = handler(method)
             if fut is not None:
                 await fut
-        if isinstance(method, (BasicDeliver, BasicReturn,
-                               ChannelClose, ConnectionClose)):
-            # These methods have their own special handling
-            return
-        if method.has_response():
-            # If the received method has responses, it means the server
-            # sent this method, not the client, thus the client doesn't
-            # wait for the reply and we shouldn't put the method into
-            # self._response
+        if method.response_to is None:
+            # The server sent this method on its own (e.g. a delivery
+            # or an exception), it is not a response the client waits for.
             return
-        await self._response.put(method)
+        if self._responses:
+            _, response = self._responses.popleft()
+            if not response.done():
+                response.set_result(method)
 
     async def __aenter__(self):
         await self.open()
@@ -127,55 +208,686 @@ class AsyncioBaseChannel(BaseChannel):
 
 
 class AsyncioChannel(AsyncioBaseChannel, Channel):
+    """
+    :param max_unconfirmed: with publisher confirms, publishers wait
+        while that many published messages are not confirmed yet.
+        Unlimited by default, can be changed between calls.
+    :param ack_flush_interval: with ``ack_batch_size`` set, buffered acks
+        are sent at most that many seconds later.
+    :param max_buffered_messages: how many delivered and returned messages
+        the channel may buffer until they are iterated over. Once it
+        buffers more, the connection stops receiving until the channel
+        buffers at most half of that, unless responses to synchronous
+        methods or publisher confirms are pending. Unlimited by default,
+        can be changed between calls.
+    :param max_buffered_bytes: the same limit for the total body size.
+    """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, max_unconfirmed=None, ack_flush_interval=0.01,
+                 max_buffered_messages=None, max_buffered_bytes=None,
+                 **kwargs):
         super().__init__(*args, **kwargs)
-        self._delivered_messages = asyncio.Queue()
+        if self._budget is None:
+            self._budget = _DeliveryBudget({})
+        self.max_buffered_messages = max_buffered_messages
+        self.max_buffered_bytes = max_buffered_bytes
+        self._buffered_messages = 0
+        self._buffered_bytes = 0
+        # Deliveries are queued per consumer tag, so a slow consumer
+        # doesn't delay the others. None ends iteration over a queue.
+        # Queues are kept while their consumers are active or iterated.
+        self._delivered_messages = {}
+        self._iterated_consumers = Counter()
+        self._returned_messages = asyncio.Queue()
+        self.max_unconfirmed = max_unconfirmed
+        self.ack_flush_interval = ack_flush_interval
+        self._ack_flush_handle = None
+        # Mapping (delivery tag -> future) of unconfirmed messages,
+        # mapping (delivery tag -> (exchange, routing key)) of those
+        # the server may return, and returned messages waiting for
+        # their acks.
+        self._confirms = {}
+        self._returnable = {}
+        self._returned = deque()
+        # Messages from that delivery tag on are tracked, but not sent.
+        self._unsent_delivery_tag = 1
+        self._window_open = asyncio.Event()
         self._method_handlers.update({
             BasicReturn: self._handle_basic_return,
             BasicDeliver: self._handle_basic_deliver,
         })
 
-    async def open(self):
-        """Open the channel."""
-        await self._channel_open()
+    async def basic_publish(self, *args, **kwargs):
+        """See :meth:`Channel.basic_publish`.
+
+        With publisher confirms, returns a future resolved when
+        the server acks the message. It raises :class:`MessageNacked`
+        on a nack and :class:`MessageReturned` if the message is returned.
+        """
+        return await self._publish(super().basic_publish, *args, **kwargs)
+
+    async def basic_publish_multi(self, *args, **kwargs):
+        """See :meth:`Channel.basic_publish_multi`.
+
+        With publisher confirms, returns a future of all the messages
+        confirmed, see :meth:`basic_publish`.
+        """
+        return await self._publish(
+            super().basic_publish_multi, *args, **kwargs
+        )
+
+    async def publish_prepared(self, *args, **kwargs):
+        """See :meth:`Channel.publish_prepared`.
+
+        With publisher confirms, returns a future of the message
+        confirmed, see :meth:`basic_publish`.
+        """
+        return await self._publish(super().publish_prepared, *args, **kwargs)
+
+    async def _publish(self, publish, *args, **kwargs):
+        if not self.publisher_confirms_active:
+            return await publish(*args, **kwargs)
+        while (self.state == 'open' and self.max_unconfirmed is not None and
+               self._unconfirmed_count >= self.max_unconfirmed):
+            self._window_open.clear()
+            await self._window_open.wait()
+        first_tag = self._next_delivery_tag
+        # Tracking a message and sending it happen without yielding
+        # to the event loop, so delivery tags follow the sending order.
+        sending = publish(*args, **kwargs)
+        loop = asyncio.get_event_loop()
+        confirms = []
+        for tag in range(first_tag, self._next_delivery_tag):
+            confirm = self._confirms[tag] = loop.create_future()
+            # Publishers may not care about the confirmation.
+            confirm.add_done_callback(_retrieve_exception)
+            confirms.append(confirm)
+        if confirms:
+            # Receiving can't stay paused, the confirms must be read.
+            self._budget.wake()
+        try:
+            await sending
+        except Exception:
+            # Nobody gets the futures, don't let wait_for_confirms()
+            # wait for them.
+            for tag in range(first_tag, first_tag + len(confirms)):
+                confirm = self._confirms.pop(tag, None)
+                if confirm is not None:
+                    confirm.cancel()
+            raise
+        if len(confirms) == 1:
+            return confirms[0]
+        confirmed = asyncio.gather(*confirms)
+        confirmed.add_done_callback(_retrieve_exception)
+        return confirmed
+
+    def _send(self, method):
+        try:
+            response = super()._send(method)
+        except Exception:
+            # Messages tracked for publisher confirms weren't sent after
+            # all, the server won't count them.
+            self._untrack_confirms(self._unsent_delivery_tag)
+            raise
+        self._unsent_delivery_tag = self._next_delivery_tag
+        return response
+
+    def _responses_pending(self):
+        return super()._responses_pending() or bool(self._confirms)
+
+    def _track_confirm(self, content, publish):
+        if (self.publisher_confirms_active and
+                (publish.mandatory or publish.immediate)):
+            self._returnable[self._next_delivery_tag] = (
+                publish.exchange, publish.routing_key,
+            )
+        super()._track_confirm(content, publish)
+
+    def _untrack_confirms(self, delivery_tag):
+        for tag in range(delivery_tag, self._next_delivery_tag):
+            self._returnable.pop(tag, None)
+        super()._untrack_confirms(delivery_tag)
+
+    async def basic_ack(self, *args, **kwargs):
+        """See :meth:`Channel.basic_ack`. Acks buffered because
+        of ``ack_batch_size`` are sent after ``ack_flush_interval``.
+        """
+        await super().basic_ack(*args, **kwargs)
+        if self._pending_acks and self._ack_flush_handle is None:
+            self._ack_flush_handle = asyncio.get_event_loop().call_later(
+                self.ack_flush_interval, self._flush_acks_later,
+            )
+
+    def _flush_acks_later(self):
+        self._ack_flush_handle = None
+        if self.state == 'open' and self._pending_acks:
+            asyncio.ensure_future(self.flush_acks())
+
+    async def wait_for_confirms(self):
+        """Wait until all messages published so far are confirmed.
+        Raises the first :class:`MessageNacked` or :class:`MessageReturned`
+        of them, if any. On ``response_timeout``, publishers keep
+        waiting for their confirms.
+        """
+        await self._wait_all(list(self._confirms.values()), shield=True)
+
+    def _handle_basic_ack(self, method):
+        self._settle(method, nacked=False)
+
+    def _handle_basic_nack(self, method):
+        self._settle(method, nacked=True)
+
+    def _settle(self, method, nacked):
+        confirmed = self._pop_confirmed(method.delivery_tag, method.multiple)
+        # The server returns a message right before acking it, so
+        # the returns received since the previous ack belong to messages
+        # this one settles. They come in the publishing order, each
+        # matches the first of those published with the mandatory
+        # or immediate flag to the same target, with the same body.
+        returned, self._returned = self._returned, deque()
+        for tag, content in confirmed:
+            exc = None
+            if nacked:
+                self._nacked_messages.append(content)
+                exc = MessageNacked(content)
+            target = self._returnable.pop(tag, None)
+            if (target is not None and returned and
+                    _is_return_of(returned[0], target, content)):
+                method = returned.popleft()
+                exc = MessageReturned(
+                    method.reply_code, method.reply_text,
+                    method.exchange, method.routing_key, content,
+                )
+            confirm = self._confirms.pop(tag, None)
+            if confirm is None or confirm.done():
+                continue
+            if exc is None:
+                confirm.set_result(None)
+            else:
+                confirm.set_exception(exc)
+        if (self.max_unconfirmed is None or
+                self._unconfirmed_count < self.max_unconfirmed):
+            self._window_open.set()
+
+    def _fail(self, exc):
+        super()._fail(exc)
+        confirms, self._confirms = self._confirms, {}
+        self._returnable.clear()
+        self._returned.clear()
+        for confirm in confirms.values():
+            if not confirm.done():
+                confirm.set_exception(exc)
+        # Let waiting publishers find out the channel is closed.
+        self._window_open.set()
+        self._stop_iteration()
+
+    async def open(self, wait=True):
+        """Open the channel.
+
+        :param wait: if unset, only send ``ChannelOpen``. Methods called
+            next, e.g. ``basic_qos`` and ``basic_consume``, follow it
+            without waiting a round trip for ``ChannelOpenOK``. If opening
+            fails, they fail with :class:`AsynchronousReply`.
+        """
+        if self.state in {'opening', 'open'}:
+            return
+        response = self._open()
+        if wait:
+            await self._wait(response)
+
+    def _open(self):
+        # The same as _channel_open(), but without waiting.
+        self.state = 'opening'
+        response = self._send(ChannelOpen())
+        # Nobody awaits the response with wait=False, don't let asyncio
+        # complain about its exception never being retrieved.
+        response.add_done_callback(_retrieve_exception)
+        return response
 
     async def close(self, reply_code=200, reply_text='OK',
                     class_id=0, method_id=0):
         """Close the channel."""
         if self.state != 'open':
             return
-        await self._channel_close(
-            reply_code, reply_text, class_id, method_id
+        await self._wait(
+            self._close(reply_code, reply_text, class_id, method_id)
+        )
+
+    def _close(self, reply_code, reply_text, class_id, method_id):
+        # The same as _channel_close(), but without waiting.
+        self.state = 'closing'
+        self._outbound_buffer.extend(self._dump_acks())
+        return self._send(
+            ChannelClose(reply_code, reply_text, class_id, method_id)
         )
 
     async def _handle_basic_return(self, method):
-        await self._delivered_messages.put(method.content)
+        if self.publisher_confirms_active:
+            # Publishers get the message through its confirm future,
+            # it's neither buffered nor counted.
+            self._returned.append(method)
+            return
+        await self._buffer(self._returned_messages, method.content)
 
     async def _handle_basic_deliver(self, method):
-        await self._delivered_messages.put(method.content)
+        consumer_tag = method.consumer_tag
+        if (consumer_tag not in self._iterated_consumers and
+                None in self._iterated_consumers):
+            # Nobody iterates over the consumer on its own, iterators
+            # over all consumers get its messages.
+            consumer_tag = None
+        await self._buffer(self._consumer_queue(consumer_tag), method.content)
+
+    async def _buffer(self, queue, content):
+        queue.put_nowait(content)
+        self._budget.add(self, content.body_size)
+        # Stop receiving (and let the transport pause reading) while
+        # too much is buffered.
+        await self._budget.wait(self)
+
+    async def _take(self, queue):
+        message = await queue.get()
+        if message is not None:
+            self._budget.remove(self, message.body_size)
+        return message
+
+    async def basic_cancel(self, consumer_tag, no_wait=False):
+        """See :meth:`Channel.basic_cancel`."""
+        response = await super().basic_cancel(consumer_tag, no_wait)
+        if no_wait:
+            self._end_consumer(consumer_tag)
+        return response
+
+    def _handle_basic_cancel_ok(self, method):
+        super()._handle_basic_cancel_ok(method)
+        self._end_consumer(method.consumer_tag)
+
+    def _handle_basic_cancel(self, method):
+        super()._handle_basic_cancel(method)
+        self._end_consumer(method.consumer_tag)
+
+    def _end_consumer(self, consumer_tag):
+        if consumer_tag in self._iterated_consumers:
+            # Iterators remove the queue once they yield the rest.
+            self._stop_iterators(consumer_tag)
+        else:
+            queue = self._delivered_messages.pop(consumer_tag, None)
+            if queue is not None:
+                self._drop_buffered(queue)
+
+    def _stop_iterators(self, consumer_tag):
+        queue = self._delivered_messages[consumer_tag]
+        for _ in range(self._iterated_consumers[consumer_tag]):
+            queue.put_nowait(None)
 
     async def _handle_channel_close(self, method):
         await super()._handle_channel_close(method)
-        exc = Reply.from_close_method(method)
-        await self._server_exception.put(exc)
-        self.state = 'closed'
+        self._fail(Reply.from_close_method(method))
+
+    def _handle_channel_close_ok(self, method):
+        super()._handle_channel_close_ok(method)
+        self._stop_iteration()
+
+    def _stop_iteration(self):
+        for queue in self._delivered_messages.values():
+            self._drop_buffered(queue)
+        self._drop_buffered(self._returned_messages)
+        self._delivered_messages = {
+            consumer_tag: queue
+            for consumer_tag, queue in self._delivered_messages.items()
+            if consumer_tag in self._iterated_consumers
+        }
+        for consumer_tag in self._delivered_messages:
+            self._stop_iterators(consumer_tag)
+        self._returned_messages.put_nowait(None)
+
+    def _drop_buffered(self, queue):
+        while not queue.empty():
+            message = queue.get_nowait()
+            if message is not None:
+                self._budget.remove(self, message.body_size)
+
+    def _consumer_queue(self, consumer_tag):
+        queue = self._delivered_messages.get(consumer_tag)
+        if queue is None:
+            queue = self._delivered_messages[consumer_tag] = asyncio.Queue()
+        return queue
+
+    def _gather_buffered(self):
+        # Move messages of consumers nobody iterates over on their own
+        # to iterators over all consumers.
+        queue = self._consumer_queue(None)
+        for consumer_tag in list(self._delivered_messages):
+            if (consumer_tag is not None and
+                    consumer_tag not in self._iterated_consumers):
+                source = self._delivered_messages.pop(consumer_tag)
+                while not source.empty():
+                    queue.put_nowait(source.get_nowait())
+
+    def _scatter_buffered(self):
+        # The opposite of _gather_buffered(), once nobody iterates over
+        # all consumers anymore.
+        queue = self._delivered_messages.pop(None, None)
+        while queue is not None and not queue.empty():
+            message = queue.get_nowait()
+            if message is None:
+                continue
+            consumer_tag = message.delivery_info.consumer_tag
+            if consumer_tag in self._consumers:
+                self._consumer_queue(consumer_tag).put_nowait(message)
+            else:
+                self._budget.remove(self, message.body_size)
+
+    @async_generator
+    async def delivered_messages(self, consumer_tag=None):
+        """Yields messages delivered to the consumer, until it is cancelled
+        or the channel is closed. Messages of a cancelled consumer
+        that were not iterated over by then are dropped.
+
+        :param consumer_tag: the consumer tag, e.g. of the
+            ``BasicConsumeOK`` reply of :meth:`basic_consume`.
+            By default, yields messages of all consumers of the channel
+            that are not iterated over on their own, until the channel
+            is closed.
+        """
+        if consumer_tag is None:
+            if None not in self._iterated_consumers:
+                self._gather_buffered()
+        elif (consumer_tag not in self._consumers and
+                consumer_tag not in self._delivered_messages):
+            return
+        queue = self._consumer_queue(consumer_tag)
+        self._iterated_consumers[consumer_tag] += 1
+        try:
+            while self.state in {'opening', 'open'}:
+                message = await self._take(queue)
+                if message is None:
+                    break
+                await yield_(message)
+        finally:
+            self._iterated_consumers[consumer_tag] -= 1
+            if not self._iterated_consumers[consumer_tag]:
+                del self._iterated_consumers[consumer_tag]
+            if consumer_tag is None:
+                if None not in self._iterated_consumers:
+                    self._scatter_buffered()
+            elif consumer_tag not in self._consumers:
+                self._end_consumer(consumer_tag)
+            elif None in self._iterated_consumers:
+                self._gather_buffered()
 
     @async_generator
-    async def delivered_messages(self):
-        """Yields delivered messages."""
-        while self.state == 'open':
-            message = await self._delivered_messages.get()
+    async def returned_messages(self):
+        """Yields messages returned by the server (published with
+        the mandatory or immediate flag), until the channel is closed.
+        With publisher confirms, returned messages are raised by their
+        confirm futures instead, see :meth:`basic_publish`.
+        """
+        while self.state in {'opening', 'open'}:
+            message = await self._take(self._returned_messages)
+            if message is None:
+                break
             await yield_(message)
 
 
+class _DeliveryBudget:
+    """Counts messages buffered by all channels of a connection
+    until they are iterated over, and pauses receiving while a channel
+    or the connection buffers too much.
+    """
+
+    def __init__(self, channels, max_messages=None, max_bytes=None):
+        self.channels = channels
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.messages = 0
+        self.bytes = 0
+        self._waiter = None
+        self._waiting_channel = None
+
+    def add(self, channel, size):
+        channel._buffered_messages += 1
+        channel._buffered_bytes += size
+        self.messages += 1
+        self.bytes += size
+
+    def remove(self, channel, size):
+        channel._buffered_messages -= 1
+        channel._buffered_bytes -= size
+        self.messages -= 1
+        self.bytes -= size
+        # Resume below the low watermark, half of the limits.
+        if (self._waiter is not None and
+                not self._exceeded(self._waiting_channel, 2)):
+            self.wake()
+
+    @property
+    def paused(self):
+        """Tells if receiving is paused."""
+        return self._waiter is not None
+
+    def wake(self):
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def wait(self, channel):
+        # Waiting for responses or publisher confirms while receiving
+        # is paused would never end, they come after the deliveries,
+        # so receiving resumes whenever there are any.
+        while (self._exceeded(channel, 1) and
+               not self._responses_pending()):
+            self._waiting_channel = channel
+            self._waiter = asyncio.get_event_loop().create_future()
+            await self._waiter
+
+    def _exceeded(self, channel, divisor):
+        return any(
+            limit is not None and value > limit // divisor
+            for limit, value in (
+                (self.max_messages, self.messages),
+                (self.max_bytes, self.bytes),
+                (channel.max_buffered_messages, channel._buffered_messages),
+                (channel.max_buffered_bytes, channel._buffered_bytes),
+            )
+        )
+
+    def _responses_pending(self):
+        # pylint: disable=protected-access
+        return any(
+            channel._responses_pending() for channel in self.channels.values()
+        )
+
+
+# asyncio.Task.current_task() is deprecated since Python 3.7.
+_current_task = getattr(
+    asyncio, 'current_task', None,
+) or asyncio.Task.current_task
+
+
+def _is_return_of(method, target, content):
+    return (
+        (method.exchange, method.routing_key) == target and
+        method.content.body == content.body
+    )
+
+
+def _retrieve_exception(future):
+    if not future.cancelled():
+        future.exception()
+
+
+class _AsyncioProtocol(_BaseProtocol):
+    """Receives data straight into the connection receive buffer.
+    Also serves as the connection writer: it implements the part
+    of the StreamWriter interface used by channels.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+        self.transport = None
+        self._paused = False
+        self._drain_waiters = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        # pylint: disable=protected-access
+        self._connection._connection_lost(exc)
+        self.resume_writing()
+
+    def get_buffer(self, sizehint):
+        return self._connection.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        # pylint: disable=protected-access
+        self._connection._data_received(nbytes)
+
+    def data_received(self, data):
+        # pylint: disable=protected-access
+        self._connection._data_received(data)
+
+    def eof_received(self):
+        return False
+
+    def pause_writing(self):
+        self._paused = True
+
+    def resume_writing(self):
+        self._paused = False
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def writelines(self, data):
+        self.transport.writelines(data)
+
+    async def drain(self):
+        if not self._paused:
+            return
+        waiter = asyncio.get_event_loop().create_future()
+        self._drain_waiters.append(waiter)
+        await waiter
+
+    def close(self):
+        self.transport.close()
+
+
+class _CoalescingWriter:
+    """Collects buffer segments sent by all channels of a connection
+    and writes them with a single ``writelines`` call once per event
+    loop iteration, or as soon as ``flush_threshold`` bytes are collected.
+
+    Draining waits while the transport write buffer is above its high
+    watermark. On a non-paused transport draining doesn't yield to
+    the event loop, so a publishing loop would never let the reader task
+    run. To guarantee it does, draining yields once writers had to flush
+    without the event loop running in between.
+    """
+
+    def __init__(self, writer, flush_threshold):
+        self._writer = writer
+        self.transport = writer.transport
+        self.flush_threshold = flush_threshold
+        self._segments = []
+        self._size = 0
+        self._flush_handle = None
+        self._yield = False
+
+    def write(self, data):
+        self.writelines([data])
+
+    def writelines(self, segments):
+        if not segments:
+            return
+        self._segments.extend(segments)
+        self._size += sum(map(len, segments))
+        if self._size >= self.flush_threshold:
+            # A scheduled flush means the event loop didn't run since.
+            self._yield = self._flush_handle is not None
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_event_loop().call_soon(
+                self.flush
+            )
+
+    def flush(self):
+        """Write the collected segments."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._segments:
+            segments, self._segments = self._segments, []
+            self._size = 0
+            self._writer.writelines(segments)
+
+    async def drain(self):
+        if self._yield:
+            self._yield = False
+            await asyncio.sleep(0)
+        await self._writer.drain()
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
 class AsyncioConnection(AsyncioBaseChannel, Connection):
+    """AMQP connection on top of asyncio.
+
+    :param buffered_protocol: if set, the connection is driven by
+        a protocol receiving data straight into the connection receive
+        buffer, instead of stream reader and writer.
+    :param flush_threshold: frames sent by all channels are written
+        to the socket together once per event loop iteration, or as soon
+        as that many bytes are waiting.
+    :param high_watermark: publishers wait once the transport write
+        buffer grows above that many bytes, until it shrinks below
+        ``low_watermark`` bytes. Both default to the transport defaults.
+    :param low_watermark: see ``high_watermark``.
+    :param max_buffered_messages: how many delivered and returned messages
+        all channels may buffer until they are iterated over, see
+        :class:`AsyncioChannel` for per-channel limits. Once they buffer
+        more, the connection stops receiving (and the transport pauses
+        reading) until they buffer at most half of that, unless responses
+        to synchronous methods or publisher confirms are pending.
+        Unlimited by default.
+    :param max_buffered_bytes: the same limit for the total body size.
+
+    Channels requested with :meth:`get_channel` before :meth:`open`
+    are opened during the handshake: ``ConnectionTuneOK``,
+    ``ConnectionOpen`` and their ``ChannelOpen`` methods are sent
+    together, and the responses are awaited at once.
+    """
+
+    # How many received methods may wait for dispatching before
+    # the protocol stops reading from the socket.
+    max_received_methods = 1024
 
     def __init__(self, host='localhost', port=5672, *,
                  ssl=None, flags=0, sock=None, local_addr=None,
-                 server_hostname=None, **kwargs):
+                 server_hostname=None, buffered_protocol=False,
+                 flush_threshold=65536, high_watermark=None,
+                 low_watermark=None, max_buffered_messages=None,
+                 max_buffered_bytes=None, **kwargs):
         super().__init__(writer=None, **kwargs)
+        self._budget = _DeliveryBudget(
+            self.channels, max_buffered_messages, max_buffered_bytes,
+        )
         self._reader = None
+        self._buffered_protocol = buffered_protocol
+        self._flush_threshold = flush_threshold
+        self._watermarks = (high_watermark, low_watermark)
+        # Received methods waiting for dispatching in the protocol mode.
+        self._received = deque()
+        self._received_waiter = None
+        self._receive_error = None
+        self._reading_paused = False
         self._connect_args = {
             'host': host,
             'port': port,
@@ -185,22 +897,33 @@ class AsyncioConnection(AsyncioBaseChannel, Connection):
             'local_addr': local_addr,
             'server_hostname': server_hostname,
         }
-        self._negotiation = asyncio.Event()
+        self._negotiation = None
         self._heartbeat_task = None
         self._communicate_task = None
 
     def _make_channel(self, channel_id):
-        return AsyncioChannel(self._writer, self._write_limit, channel_id)
+        return AsyncioChannel(
+            self._writer, channel_id, response_timeout=self.response_timeout,
+            budget=self._budget,
+        )
 
     async def _handle_connection_tune(self, method):
         self._heartbeat_task = asyncio.ensure_future(self._start_heartbeat())
 
         await super()._handle_connection_tune(method)
-        self._negotiation.set()
+        # Don't wait a round trip for open() to send ConnectionOpen,
+        # it is written together with ConnectionTuneOK, and so are
+        # ChannelOpen methods of the channels requested in advance.
+        responses = [self._send(ConnectionOpen(self.virtual_host))]
+        for channel in self.channels.values():
+            if channel is not self and channel.state == 'closed':
+                # pylint: disable=protected-access
+                responses.append(channel._open())
+        self._negotiation.set_result(responses)
 
     async def _send_heartbeat(self):
         super()._send_heartbeat()
-        self._writer.write(self.data_to_send())
+        self._writer.writelines(self.segments_to_send())
         await self._writer.drain()
 
     async def _start_heartbeat(self):
@@ -209,58 +932,178 @@ class AsyncioConnection(AsyncioBaseChannel, Connection):
         transport_closing = self._writer.transport.is_closing
         while self.state in {'opening', 'open'} and not transport_closing():
             await self._send_heartbeat()
-            self._missed_heartbeats += 1
+            # Server heartbeats wait in the socket while receiving
+            # is paused, they are not missed.
+            if not self._budget.paused:
+                self._missed_heartbeats += 1
             await asyncio.sleep(self.negotiated_settings.heartbeat)
 
     async def open(self):
         """Open the connection."""
-        self._reader, self._writer = await asyncio.open_connection(
-            **self._connect_args,
-        )
+        if self._buffered_protocol:
+            _, writer = await asyncio.get_event_loop().create_connection(
+                lambda: _AsyncioProtocol(self), **self._connect_args,
+            )
+            communicate = self._dispatch_received()
+        else:
+            self._reader, writer = await asyncio.open_connection(
+                **self._connect_args,
+            )
+            communicate = self._communicate()
+        high_watermark, low_watermark = self._watermarks
+        if high_watermark is not None or low_watermark is not None:
+            writer.transport.set_write_buffer_limits(
+                high=high_watermark, low=low_watermark,
+            )
+        self._writer = _CoalescingWriter(writer, self._flush_threshold)
+        for channel in self.channels.values():
+            channel._writer = self._writer
+        self._negotiation = asyncio.get_event_loop().create_future()
         self.initiate_connection()
-        self._writer.write(self.data_to_send())
+        self._writer.writelines(self.segments_to_send())
+
+        self._communicate_task = asyncio.ensure_future(communicate)
 
-        self._communicate_task = asyncio.ensure_future(self._communicate())
+        responses = await self._wait(self._negotiation)
+        await self._wait_all(responses)
 
-        await self._result_or_exception(self._negotiation.wait())
-        await self._connection_open()
+    async def open_channels(self, count):
+        """Open ``count`` new channels at once: all ``ChannelOpen`` methods
+        are sent together and the responses are awaited concurrently.
+        """
+        channels = [self.get_channel() for _ in range(count)]
+        # pylint: disable=protected-access
+        await self._wait_all([channel._open() for channel in channels])
+        return channels
+
+    async def close_channels(self, reply_code=200, reply_text='OK',
+                             class_id=0, method_id=0):
+        """Close all open channels at once, the same way
+        :meth:`open_channels` opens them.
+        """
+        # pylint: disable=protected-access
+        await self._wait_all([
+            channel._close(reply_code, reply_text, class_id, method_id)
+            for channel in list(self.channels.values())
+            if channel is not self and channel.state == 'open'
+        ])
 
     async def close(self, reply_code=200, reply_text='OK',
-                    class_id=0, method_id=0):
-        """Close the connection and all its channels."""
+                    class_id=0, method_id=0, timeout=None):
+        """Close the connection and all its channels.
+
+        :param timeout: how many seconds closing may take. After that,
+            the socket is closed without waiting for the rest
+            of the responses. Forever by default.
+        """
         if self.state != 'open':
             return
-        for channel in self.channels.values():
-            if channel.channel_id == 0:
-                continue  # Do not try close itself.
-            await channel.close(
-                reply_code, reply_text, class_id, method_id,
+        try:
+            await asyncio.wait_for(
+                self._close_gracefully(
+                    reply_code, reply_text, class_id, method_id,
+                ),
+                timeout,
             )
+        except asyncio.TimeoutError:
+            logging.warning('closing timed out after %ss', timeout)
+        finally:
+            self._writer.close()
+            self._heartbeat_task.cancel()
+            await self._communicate_task
+
+    async def _close_gracefully(self, reply_code, reply_text,
+                                class_id, method_id):
+        await self.close_channels(reply_code, reply_text, class_id, method_id)
         await self._connection_close(
             reply_code, reply_text, class_id, method_id
         )
-        self._writer.close()
-        self._heartbeat_task.cancel()
-        await self._communicate_task
 
     async def _handle_connection_close(self, method):
         await super()._handle_connection_close(method)
-        exc = Reply.from_close_method(method)
-        await self._server_exception.put(exc)
-        self.state = 'closed'
+        self._fail(Reply.from_close_method(method))
+
+    def _fail(self, exc):
+        # A connection exception closes all its channels too.
+        for channel in self.channels.values():
+            if channel is not self:
+                channel._fail(exc)
+        if self._negotiation is not None and not self._negotiation.done():
+            self._negotiation.set_exception(exc)
+        super()._fail(exc)
 
     async def _communicate(self):
         try:
             transport_closing = self._writer.transport.is_closing
-            while (self.state in {'opening', 'open'} and
-                    not transport_closing()):
+            # Keep receiving while closing, responses to methods sent
+            # before the close may still precede ConnectionCloseOK.
+            while self.state != 'closed' and not transport_closing():
                 frame_max = self.negotiated_settings.frame_max
                 data = await self._reader.read(frame_max)
                 if not data:
-                    raise ConnectionAborted
-                for channel_id, methods in self.parse_data(data).items():
-                    channel = self.channels[channel_id]
-                    for method in methods:
+                    raise ConnectionAborted('connection lost')
+                events = self.iter_events(data)
+                while True:
+                    for channel, method in events:
                         await channel._receive_method(method)
-        except Exception as exc:
-            await self._client_exception.put(exc)
+                    if not self.parse_pending:
+                        break
+                    # The parse budget is spent, let other tasks run
+                    # before parsing the rest of the data.
+                    await asyncio.sleep(0)
+                    events = self.iter_events()
+        except Exception as exc:  # pylint: disable=broad-except
+            self._fail(exc)
+
+    def _data_received(self, data):
+        # Called by the protocol with the number of bytes received
+        # into the receive buffer, or with the received bytes.
+        if isinstance(data, int):
+            self._inbound_buffer.buffer_updated(data)
+        else:
+            self._inbound_buffer.write(data)
+        try:
+            self._received.extend(self.iter_events())
+        except Exception as exc:  # pylint: disable=broad-except
+            self._receive_error = exc
+        pause = (len(self._received) >= self.max_received_methods or
+                 self.parse_pending or self._budget.paused)
+        if pause and not self._reading_paused:
+            self._reading_paused = True
+            self._writer.transport.pause_reading()
+        self._wake_dispatcher()
+
+    def _connection_lost(self, exc):
+        if self._receive_error is None:
+            self._receive_error = exc or ConnectionAborted('connection lost')
+        self._wake_dispatcher()
+
+    def _wake_dispatcher(self):
+        waiter, self._received_waiter = self._received_waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def _dispatch_received(self):
+        received = self._received
+        try:
+            while self.state != 'closed':
+                if self.parse_pending:
+                    # The parse budget is spent, let other tasks run
+                    # before parsing the rest of the data.
+                    await asyncio.sleep(0)
+                    received.extend(self.iter_events())
+                elif not received:
+                    if self._receive_error is not None:
+                        raise self._receive_error
+                    if self._reading_paused:
+                        self._reading_paused = False
+                        self._writer.transport.resume_reading()
+                    self._received_waiter = (
+                        asyncio.get_event_loop().create_future()
+                    )
+                    await self._received_waiter
+                while received:
+                    channel, method = received.popleft()
+                    await channel._receive_method(method)
+        except Exception as exc:  # pylint: disable=broad-except
+            self._fail(exc)
@@ -0,0 +1,79 @@
+"""
+amqproto.buffer
+~~~~~~~~~~~~~~~
+
+Receive buffer.
+"""
+
+
+class ReceiveBuffer:
+    """A buffer received data is written into in place (``recv_into``
+    style) and consumed from a read offset.
+
+    Consumed data is never overwritten, so frame payloads (like content
+    bodies) can be handed out as ``memoryview`` slices of the buffer.
+    Once the free space runs out, the unconsumed data is moved into
+    a newly allocated buffer: a compacted one if the consumed prefix
+    passed the threshold, a larger one otherwise.
+
+    :param size: the initial buffer size.
+    :param compact_threshold: how many bytes must be consumed before
+        the buffer is compacted rather than grown. Half of the size
+        by default.
+    """
+
+    __slots__ = ('size', 'compact_threshold', '_buffer', '_start', '_end')
+
+    def __init__(self, size=128 * 1024, compact_threshold=None):
+        if compact_threshold is None:
+            compact_threshold = size // 2
+        self.size = size
+        self.compact_threshold = compact_threshold
+        self._buffer = bytearray(size)
+        self._start = self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def get_buffer(self, sizehint=-1) -> memoryview:
+        """Return a writable memoryview of at least ``sizehint`` bytes
+        to receive data into. Report how many bytes were written with
+        :meth:`buffer_updated`.
+        """
+        needed = max(sizehint, self.size // 4, 1)
+        if len(self._buffer) - self._end < needed:
+            self._reallocate(needed)
+        return memoryview(self._buffer)[self._end:]
+
+    def buffer_updated(self, nbytes: int):
+        """Tell the buffer ``nbytes`` were written into
+        the :meth:`get_buffer` memoryview.
+        """
+        self._end += nbytes
+
+    def write(self, data: bytes):
+        """Copy the data into the buffer."""
+        nbytes = len(data)
+        self.get_buffer(nbytes)[:nbytes] = data
+        self._end += nbytes
+
+    def view(self) -> memoryview:
+        """Return a memoryview of the unconsumed data."""
+        return memoryview(self._buffer)[self._start:self._end]
+
+    def consume(self, nbytes: int):
+        """Mark ``nbytes`` of the unconsumed data as consumed."""
+        self._start += nbytes
+
+    def _reallocate(self, needed):
+        data_size = self._end - self._start
+        if self._start >= self.compact_threshold:
+            size = max(self.size, data_size + needed)
+        else:
+            size = max(len(self._buffer) * 2, data_size + needed)
+        # Exported memoryviews may still refer to the old buffer,
+        # so it is left intact.
+        buffer = bytearray(size)
+        buffer[:data_size] = self.view()
+        self._buffer = buffer
+        self._start, self._end = 0, data_size
@@ -9,8 +9,9 @@ AMQP channels.
 # pylint: disable=attribute-defined-outside-init,no-member
 
 import uuid
+import typing
 import warnings
-from io import BytesIO
+from struct import Struct
 from collections import deque
 
 import attr
@@ -19,7 +20,14 @@ from . import methods
 from . import replies
 from .settings import Settings
 from .content import BasicContent
-from .serialization import dump_frame_method, dump_frame_content
+from .serialization import (
+    dump_frame_method, dump_frame_content_segments, dump_frame_body_segments,
+)
+
+_body_size = Struct('>Q')
+# Offset of the body size in a content header frame:
+# the frame header (7 bytes), class id and weight (2 bytes each).
+_BODY_SIZE_OFFSET = 11
 
 
 @attr.s()
@@ -31,6 +39,12 @@ class BaseChannel:
 
     channel_id = attr.ib(default=0)
 
+    # The type of received content bodies: bytes, bytearray or memoryview.
+    body_type = attr.ib(default=bytes)
+
+    # An optional TableCache to dump field tables with.
+    table_cache = attr.ib(default=None)
+
     server_settings = attr.ib(
         default=attr.Factory(lambda: Settings(type='server')),
         init=False,
@@ -46,10 +60,15 @@ class BaseChannel:
     state = attr.ib(default='closed', init=False)
 
     def __attrs_post_init__(self):
-        # The buffer to accumulate all bytes required to be sent.
-        self._outbound_buffer = BytesIO()
+        # The buffer segments required to be sent.
+        self._outbound_buffer = []
         # Reference to the last received method waiting for its content.
         self._content_waiter = None
+        # The body of the content being received: a list of chunks joined
+        # once the content is complete for bytes bodies, or a buffer
+        # preallocated from the body size otherwise.
+        self._content_body = None
+        self._content_body_received = 0
 
     def capable_of(self, method: methods.Method, capability: str):
         """
@@ -68,11 +87,20 @@ class BaseChannel:
         """
         Returns the data to send.
         """
-        data = self._outbound_buffer.getvalue()
-        if data:
-            # Avoid unnecessary reallocations if there is nothing to send
-            self._outbound_buffer = BytesIO()
-        return data
+        return b''.join(self.segments_to_send())
+
+    def segments_to_send(self) -> typing.List[bytes]:
+        """
+        Returns the data to send as a list of buffer segments, suitable
+        for ``writelines``. Content bodies are not copied: segments
+        may be ``memoryview`` slices of them, so a mutable body must not
+        be modified until the segments are written.
+        """
+        segments = self._outbound_buffer
+        if segments:
+            # Avoid unnecessary allocations if there is nothing to send
+            self._outbound_buffer = []
+        return segments
 
     def _handle_method(self, method):
         # We assume that the server won't send us methods we don't explicitly
@@ -94,32 +122,66 @@ class BaseChannel:
         self._content_waiter.content = content
         if content.complete():
             # An empty body
+            content.body = self.body_type(content.body)
             waiter, self._content_waiter = self._content_waiter, None
             return [waiter]
+        if self.body_type is bytes:
+            self._content_body = []
+        else:
+            self._content_body = bytearray(content.body_size)
+        self._content_body_received = 0
         return []
 
     def _handle_content_body(self, payload):
         waiter = self._content_waiter
-        waiter.content.body += payload
-        if waiter.content.complete():
-            waiter, self._content_waiter = self._content_waiter, None
-            return [waiter]
-        return []
+        content = waiter.content
+        start = self._content_body_received
+        end = self._content_body_received = start + len(payload)
+        if end > content.body_size:
+            raise replies.FrameError(
+                'content body is larger than {} bytes'.format(
+                    content.body_size
+                )
+            )
+        if end == content.body_size and start == 0:
+            # The whole body is in a single frame. Even a memoryview
+            # can be handed out without copying: the payload is a slice
+            # of a receive buffer that is never overwritten.
+            body = self.body_type(payload)
+        elif self.body_type is bytes:
+            self._content_body.append(payload)
+            if end < content.body_size:
+                return []
+            body = b''.join(self._content_body)
+        else:
+            self._content_body[start:end] = payload
+            if end < content.body_size:
+                return []
+            body = self._content_body
+            if self.body_type is memoryview:
+                body = memoryview(body)
+        content.body = body
+        self._content_body = None
+        waiter, self._content_waiter = self._content_waiter, None
+        return [waiter]
 
     def _prepare_for_sending(self, method):
         """
         Prepare the method for sending (including the content,
         if there is one).
         """
-        self._outbound_buffer.write(
-            dump_frame_method(self.channel_id, method)
+        if method.__class__ is _Serialized:
+            self._outbound_buffer.extend(method.segments)
+            return
+        self._outbound_buffer.append(
+            dump_frame_method(self.channel_id, method, self.table_cache)
         )
         if not method.followed_by_content:
             return
         max_frame_size = self.negotiated_settings.frame_max - 8
-        self._outbound_buffer.write(
-            dump_frame_content(self.channel_id, method.content, max_frame_size)
-        )
+        self._outbound_buffer.extend(dump_frame_content_segments(
+            self.channel_id, method.content, max_frame_size, self.table_cache,
+        ))
 
 
 @attr.s()
@@ -128,8 +190,20 @@ class Channel(BaseChannel):
     Maintains per-channel state.
 
     :param channel_id: channel id, unique within a single connection.
+    :param ack_batch_size: if set, :meth:`basic_ack` of single messages
+        only buffers the acks until that many are buffered or
+        :meth:`flush_acks` is called. Acks of contiguous delivery tags
+        are sent as one ``multiple`` ack. Every message delivered on
+        the channel must be acked, rejected or nacked eventually,
+        otherwise acks after its delivery tag are sent one by one.
+        Once more than ``max_settled_tags`` messages are settled after it,
+        only the contiguous run of them right after it is remembered,
+        so acks after any other unsettled message are not batched anymore.
     """
 
+    ack_batch_size = attr.ib(default=None)
+    max_settled_tags = 4096
+
     flow_active = attr.ib(default=True, init=False)
     transaction_active = attr.ib(default=False, init=False)
     publisher_confirms_active = attr.ib(default=False, init=False)
@@ -138,11 +212,25 @@ class Channel(BaseChannel):
         super().__attrs_post_init__()
         # Set of all active consumer tags.
         self._consumers = set()
-        # Mapping (delivery tag -> content) of unconfirmed messages.
-        self._unconfirmed_messages = {}
+        # Contents of unconfirmed messages in delivery tag order,
+        # starting from _first_unconfirmed_tag. Messages confirmed before
+        # the ones published earlier are replaced with None, so confirming
+        # k messages costs O(k).
+        self._unconfirmed_messages = deque()
+        self._first_unconfirmed_tag = 1
+        self._unconfirmed_count = 0
         self._next_delivery_tag = 1
         # A list of messages that have been explicitly nacked by the server.
         self._nacked_messages = deque()
+        # Batched acks: all messages up to _settled_up_to delivery tag
+        # are acked, rejected or nacked by the client. Above it, delivery
+        # tags of settled messages, and acks not sent yet. Too many
+        # settled delivery tags are collapsed into the (first, last)
+        # range of them following the first unsettled message.
+        self._settled_up_to = 0
+        self._settled_tags = set()
+        self._settled_run = None
+        self._pending_acks = set()
 
         self._method_handlers = {
             methods.ChannelOpenOK: self._handle_channel_open_ok,
@@ -173,6 +261,8 @@ class Channel(BaseChannel):
             reply_code, reply_text, class_id, method_id
         )
         self.state = 'closing'
+        # Send batched acks first, so the messages are not redelivered.
+        self._outbound_buffer.extend(self._dump_acks())
         return self._prepare_for_sending(method)
 
     def _handle_channel_close_ok(self, method):
@@ -631,11 +721,83 @@ class Channel(BaseChannel):
         method = methods.BasicPublish(
             0, exchange, routing_key, mandatory, immediate, content
         )
-        if self.publisher_confirms_active:
-            self._unconfirmed_messages[self._next_delivery_tag] = content
-            self._next_delivery_tag += 1
+        self._track_confirm(content, method)
         return self._prepare_for_sending(method)
 
+    def basic_publish_multi(self, content, targets,
+                            mandatory=False, immediate=False):
+        """This method publishes the same message to several exchanges
+        and routing keys. The content is serialized once and its frames
+        are reused after every BasicPublish method.
+
+        :param content: Specifies the content to send.
+
+        :param targets: An iterable of (exchange, routing key) pairs.
+
+        See :meth:`basic_publish` for other parameters.
+        """
+        if not isinstance(content, (bytes, BasicContent)):
+            raise TypeError('content must be bytes or amqproto.BasicContent,'
+                            f' got {type(content)}')
+        if isinstance(content, bytes):
+            content = BasicContent(body=content, body_size=len(content))
+        max_frame_size = self.negotiated_settings.frame_max - 8
+        header, *body = dump_frame_content_segments(
+            self.channel_id, content, max_frame_size, self.table_cache,
+        )
+        segments = []
+        for exchange, routing_key in targets:
+            method = methods.BasicPublish(
+                0, exchange, routing_key, mandatory, immediate,
+            )
+            segments.append(dump_frame_method(
+                self.channel_id, method, self.table_cache,
+            ) + header)
+            segments.extend(body)
+            self._track_confirm(content, method)
+        return self._prepare_for_sending(_Serialized('BasicPublish', segments))
+
+    def prepare_publish(self, exchange='', routing_key='', properties=None,
+                        mandatory=False, immediate=False):
+        """Serialize the BasicPublish method and the content header once
+        for publishing many messages with the same exchange, routing key
+        and properties. See :meth:`basic_publish` for the parameters.
+
+        :param properties: :class:`~amqproto.content.BasicProperties`
+            of the messages.
+
+        Returns a :class:`PreparedPublish`, publish bodies with its
+        :meth:`PreparedPublish.publish` method.
+        """
+        return PreparedPublish(
+            self, exchange, routing_key, properties, mandatory, immediate,
+        )
+
+    def publish_prepared(self, prepared, body):
+        """Publish a message body with the prepared BasicPublish method.
+
+        :param prepared: a :class:`PreparedPublish` of this channel.
+
+        :param body: the message body, a bytes-like object.
+        """
+        if prepared.channel is not self:
+            raise ValueError('the publish is prepared for another channel')
+        body_size = len(body)
+        if self.publisher_confirms_active:
+            self._track_confirm(
+                BasicContent(body, body_size, prepared.properties), prepared,
+            )
+        head = prepared.head + _body_size.pack(body_size) + prepared.tail
+        segments = [head]
+        if body_size:
+            max_frame_size = self.negotiated_settings.frame_max - 8
+            segments = dump_frame_body_segments(
+                self.channel_id, body, body_size, max_frame_size,
+            )
+            # Send the first body frame header along with the other headers.
+            segments[0] = head + segments[0]
+        return self._prepare_for_sending(_Serialized('BasicPublish', segments))
+
     def basic_get(self, queue, no_ack=False):
         """This method provides a direct access to the messages in a queue
         using a synchronous dialogue that is designed for specific types of
@@ -673,17 +835,105 @@ class Channel(BaseChannel):
             all outstanding messages.
         """
         method = methods.BasicAck(delivery_tag, multiple)
-        return self._prepare_for_sending(method)
+        if self.ack_batch_size is None:
+            return self._prepare_for_sending(method)
+        if multiple:
+            return self._send_settling(method)
+        self._pending_acks.add(delivery_tag)
+        self._settled_tags.add(delivery_tag)
+        segments = []
+        if len(self._pending_acks) >= self.ack_batch_size:
+            # Keep acks after a gap while there are few of them, the gap
+            # is likely to be filled soon.
+            segments = self._dump_acks(
+                keep=self.ack_batch_size // 2,
+            )
+        return self._prepare_for_sending(_Serialized('BasicAck', segments))
 
-    def _handle_basic_ack(self, method):
-        if method.multiple:
-            self._unconfirmed_messages = {
-                tag: content
-                for tag, content in self._unconfirmed_messages.items()
-                if tag not in range(1, method.delivery_tag + 1)
+    def flush_acks(self):
+        """Send the acks buffered by :meth:`basic_ack`,
+        see ``ack_batch_size``.
+        """
+        return self._prepare_for_sending(
+            _Serialized('BasicAck', self._dump_acks())
+        )
+
+    def _dump_acks(self, keep=0):
+        # Everything up to the highest buffered ack among contiguous
+        # settled delivery tags is acked with one multiple ack. The server
+        # ignores settled messages covered by it, but the delivery tag
+        # of the ack itself must not be settled yet. Acks after a gap
+        # (a message still being handled) are sent one by one, unless
+        # there are at most ``keep`` of them.
+        settled = self._settled_tags
+        pending = self._pending_acks
+        settled_up_to = self._settled_up_to
+        run = self._settled_run
+        while True:
+            if settled_up_to + 1 in settled:
+                settled_up_to += 1
+                settled.remove(settled_up_to)
+            elif run is not None and run[0] <= settled_up_to + 1:
+                settled_up_to = max(settled_up_to, run[1])
+                run = None
+            else:
+                break
+        contiguous = [tag for tag in pending if tag <= settled_up_to]
+        acks = []
+        if contiguous:
+            acks.append(methods.BasicAck(max(contiguous), len(contiguous) > 1))
+            pending.difference_update(contiguous)
+        overflow = len(settled) > self.max_settled_tags
+        if len(pending) > keep or overflow:
+            acks.extend(
+                methods.BasicAck(tag, False) for tag in sorted(pending)
+            )
+            pending.clear()
+        if overflow:
+            # All the acks are sent, only remember the settled messages
+            # right after the first unsettled one, as a range.
+            first, last = run or (settled_up_to + 2, settled_up_to + 1)
+            while last + 1 in settled:
+                last += 1
+            run = (first, last) if last >= first else None
+            settled.clear()
+        self._settled_up_to = settled_up_to
+        self._settled_run = run
+        return [
+            dump_frame_method(self.channel_id, ack, self.table_cache)
+            for ack in acks
+        ]
+
+    def _send_settling(self, method):
+        # Send a method that settles messages by itself after the buffered
+        # acks, because a multiple reject could cover buffered acks.
+        segments = self._dump_acks()
+        segments.append(
+            dump_frame_method(self.channel_id, method, self.table_cache)
+        )
+        if getattr(method, 'multiple', False):
+            settled = self._settled_tags
+            if method.delivery_tag:
+                settled_up_to = max(self._settled_up_to, method.delivery_tag)
+            else:
+                # Zero delivery tag means all outstanding messages.
+                settled_up_to = max(settled, default=self._settled_up_to)
+                if self._settled_run is not None:
+                    settled_up_to = max(
+                        settled_up_to, self._settled_run[1],
+                    )
+            self._settled_up_to = settled_up_to
+            self._settled_tags = {
+                tag for tag in settled if tag > settled_up_to
             }
         else:
-            self._unconfirmed_messages.pop(method.delivery_tag)
+            self._settled_tags.add(method.delivery_tag)
+        return self._prepare_for_sending(
+            _Serialized(method.__class__.__name__, segments)
+        )
+
+    def _handle_basic_ack(self, method):
+        self._pop_confirmed(method.delivery_tag, method.multiple)
 
     def basic_reject(self, delivery_tag, requeue=False):
         """This method allows a client to reject a message.
@@ -698,6 +948,8 @@ class Channel(BaseChannel):
             attempt fails the messages are discarded or dead-lettered.
         """
         method = methods.BasicReject(delivery_tag, requeue)
+        if self.ack_batch_size is not None:
+            return self._send_settling(method)
         return self._prepare_for_sending(method)
 
     def basic_recover_async(self, requeue=False):
@@ -752,11 +1004,64 @@ class Channel(BaseChannel):
             attempt fails the messages are discarded or dead-lettered.
         """
         method = methods.BasicNack(delivery_tag, multiple, requeue)
+        if self.ack_batch_size is not None:
+            return self._send_settling(method)
         return self._prepare_for_sending(method)
 
     def _handle_basic_nack(self, method):
-        # TODO
-        self._nacked_messages.append(method.delivery_tag)
+        self._nacked_messages.extend(
+            content for _, content in
+            self._pop_confirmed(method.delivery_tag, method.multiple)
+        )
+
+    def _track_confirm(self, content, publish):
+        """Track a message published with ``publish``, a ``BasicPublish``
+        method or a :class:`PreparedPublish`, for publisher confirms.
+        """
+        # pylint: disable=unused-argument
+        if self.publisher_confirms_active:
+            self._unconfirmed_messages.append(content)
+            self._unconfirmed_count += 1
+            self._next_delivery_tag += 1
+
+    def _untrack_confirms(self, delivery_tag):
+        """Stop tracking messages from ``delivery_tag`` on, because
+        they were not sent after all.
+        """
+        count = self._next_delivery_tag - delivery_tag
+        for _ in range(count):
+            self._unconfirmed_messages.pop()
+        self._unconfirmed_count -= count
+        self._next_delivery_tag = delivery_tag
+
+    def _pop_confirmed(self, delivery_tag, multiple):
+        """Stop tracking messages acked or nacked by the server,
+        return their (delivery tag, content) pairs.
+        """
+        unconfirmed = self._unconfirmed_messages
+        first_tag = self._first_unconfirmed_tag
+        index = delivery_tag - first_tag
+        if multiple:
+            # Zero delivery tag means all outstanding messages.
+            count = index + 1 if delivery_tag else len(unconfirmed)
+            count = min(count, len(unconfirmed))
+            confirmed = []
+            for tag in range(first_tag, first_tag + count):
+                content = unconfirmed.popleft()
+                if content is not None:
+                    confirmed.append((tag, content))
+        elif 0 <= index < len(unconfirmed) and unconfirmed[index] is not None:
+            confirmed = [(delivery_tag, unconfirmed[index])]
+            unconfirmed[index] = None
+        else:
+            confirmed = []
+        while unconfirmed and unconfirmed[0] is None:
+            unconfirmed.popleft()
+        self._first_unconfirmed_tag = (
+            self._next_delivery_tag - len(unconfirmed)
+        )
+        self._unconfirmed_count -= len(confirmed)
+        return confirmed
 
     def tx_select(self):
         """This method sets the channel to use standard transactions.
@@ -803,3 +1108,59 @@ class Channel(BaseChannel):
     def _handle_confirm_select_ok(self, method):
         # pylint: disable=unused-argument
         self.publisher_confirms_active = True
+
+
+@attr.s(slots=True)
+class PreparedPublish:
+    """A BasicPublish method and a content header serialized once
+    by :meth:`Channel.prepare_publish`. Publishing a body only patches
+    the body size in the content header and adds body frames.
+    """
+
+    channel = attr.ib()
+    exchange = attr.ib(default='')
+    routing_key = attr.ib(default='')
+    properties = attr.ib(default=None)
+    mandatory = attr.ib(default=False)
+    immediate = attr.ib(default=False)
+
+    # The method frame and the content header up to the body size.
+    head = attr.ib(init=False, repr=False)
+    # The content header after the body size.
+    tail = attr.ib(init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        channel = self.channel
+        method = methods.BasicPublish(
+            0, self.exchange, self.routing_key, self.mandatory, self.immediate,
+        )
+        content = BasicContent(b'', 0, self.properties)
+        self.properties = content.properties
+        header = dump_frame_content_segments(
+            channel.channel_id, content, 1, channel.table_cache,
+        )[0]
+        self.head = dump_frame_method(
+            channel.channel_id, method, channel.table_cache,
+        ) + header[:_BODY_SIZE_OFFSET]
+        self.tail = header[_BODY_SIZE_OFFSET + _body_size.size:]
+
+    def publish(self, body):
+        """Publish a message body, see :meth:`Channel.publish_prepared`."""
+        return self.channel.publish_prepared(self, body)
+
+
+@attr.s(slots=True)
+class _Serialized:
+    """Already serialized frames sent as is by ``_prepare_for_sending``.
+    Quacks like a method without a response.
+    """
+
+    name = attr.ib()
+    segments = attr.ib(repr=False)
+
+    closing = False
+    followed_by_content = False
+
+    def has_response(self):
+        # pylint: disable=no-self-use
+        return False
@@ -8,6 +8,7 @@ Sans-I/O implementations of AMQP connections.
 # Pylint can't handle attrs magic.
 # pylint: disable=attribute-defined-outside-init,no-member,assigning-non-slot
 
+import sys
 import typing
 from io import BytesIO
 from collections import defaultdict
@@ -17,10 +18,11 @@ import attr
 from . import sasl
 from . import replies
 from . import methods
+from .buffer import ReceiveBuffer
 from .settings import Settings
 from .channel import BaseChannel, Channel
 from .serialization import (
-    parse_protocol_header, parse_frames,
+    FrameType, parse_protocol_header, parse_frame, scan_frame,
     dump_protocol_header, dump_frame_heartbeat,
 )
 
@@ -31,6 +33,23 @@ class Connection(BaseChannel):
     state and creates channels.
 
     :param auth: SASL method to authenticate with the server.
+    :param body_type: the type of received content bodies. ``bytes``
+        (the default) costs one copy of the body, ``bytearray``
+        and ``memoryview`` are assembled in place in a buffer preallocated
+        from the body size and are handed out without a final copy.
+    :param lazy_tables: if set, field tables of received methods and
+        content headers (e.g. message headers) are loaded as read-only
+        :class:`~amqproto.serialization.LazyTable` mappings, decoded only
+        when accessed.
+    :param table_cache: an optional
+        :class:`~amqproto.serialization.TableCache` shared by all channels
+        to reuse encoded field tables (e.g. message headers or declare
+        arguments) sent over and over.
+    :param parse_max_frames: the maximum number of frames parsed per
+        :meth:`parse_data` call. The rest of the data stays buffered,
+        see :attr:`parse_pending`. Unlimited by default.
+    :param parse_max_bytes: the same limit in bytes. At least one frame
+        is parsed per call.
     """
 
     virtual_host = attr.ib(default='/')
@@ -44,6 +63,9 @@ class Connection(BaseChannel):
     channel_max = attr.ib(default=0)
     frame_max = attr.ib(default=0)
     heartbeat = attr.ib(default=60)
+    lazy_tables = attr.ib(default=False)
+    parse_max_frames = attr.ib(default=None)
+    parse_max_bytes = attr.ib(default=None)
 
     client_settings = attr.ib(
         default=attr.Factory(
@@ -69,7 +91,10 @@ class Connection(BaseChannel):
         self.channels = {0: self}
         self._next_channel_id = 1
 
-        self._inbound_buffer = bytearray()
+        # Received data that has not been parsed yet, and how much data
+        # must be buffered to complete the next frame.
+        self._inbound_buffer = ReceiveBuffer()
+        self._parse_at = 0
 
         self._missed_heartbeats = 0
 
@@ -88,40 +113,108 @@ class Connection(BaseChannel):
         into list of AMQP frames. This method also handles buffering,
         so it's intended to directly pass bytes received from elsewhere.
         """
-        self._missed_heartbeats = 0
-
-        self._inbound_buffer += data
-        stream = BytesIO(self._inbound_buffer)
+        received_methods = defaultdict(list)
+        for channel, method in self.iter_events(data):
+            received_methods[channel.channel_id].append(method)
+        return received_methods
 
-        if data[0] == b'A':
-            server_version = parse_protocol_header(stream)
+    def iter_events(self, data: bytes = b'') -> typing.Iterator[
+            typing.Tuple[BaseChannel, methods.Method]]:
+        """
+        Like :meth:`parse_data`, but yields (channel, method) pairs
+        as soon as every frame is parsed, without collecting all methods
+        first. The data is buffered as soon as this is called; if
+        the generator is closed before it is exhausted (or is never
+        iterated), the unparsed data stays buffered until the next call.
+        """
+        self._missed_heartbeats = 0
+        if data:
+            # Buffer the data right away, so it is not lost even if
+            # the generator is never iterated.
+            self._inbound_buffer.write(data)
+        return self._iter_events()
+
+    def _iter_events(self) -> typing.Iterator[
+            typing.Tuple[BaseChannel, methods.Method]]:
+        buffer = self._inbound_buffer
+        if len(buffer) < self._parse_at:
+            # The pending frame is still incomplete, there's nothing
+            # to parse yet.
+            return
+        view = buffer.view()
+
+        # Content body payloads are memoryview slices of the view.
+        # They are safe to hand out: the receive buffer never overwrites
+        # parsed frames.
+        if view[:1] == b'A':
+            server_version = parse_protocol_header(BytesIO(view.tobytes()))
             raise replies.ConnectionAborted(
                 'AMQP version mismatch, we are {}, server is {}'.format(
-                    '.'.join(self.protocol_version),
-                    '.'.join(server_version),
+                    '.'.join(map(str, self.protocol_version)),
+                    '.'.join(map(str, server_version)),
                 )
             )
 
-        received_methods = defaultdict(list)
-        for channel_id, frame_type, payload in parse_frames(stream):
-            # pylint: disable=protected-access
-            channel = self.channels[channel_id]
-            if frame_type.name == 'METHOD':
-                received_methods[channel_id].extend(
-                    channel._handle_method(payload)
-                )
-            elif frame_type.name == 'CONTENT_HEADER':
-                received_methods[channel_id].extend(
-                    channel._handle_content_header(payload)
-                )
-            elif frame_type.name == 'CONTENT_BODY':
-                received_methods[channel_id].extend(
-                    channel._handle_content_body(payload)
-                )
-            elif frame_type.name == 'HEARTBEAT':
-                pass
-        self._inbound_buffer = bytearray(stream.read())
-        return received_methods
+        max_frames = self.parse_max_frames or sys.maxsize
+        max_bytes = self.parse_max_bytes or sys.maxsize
+        offset = needed = frames = 0
+        try:
+            while True:
+                # Only decode the frame once it is received completely.
+                needed = scan_frame(view, offset)
+                if needed or frames >= max_frames or offset >= max_bytes:
+                    break
+                frames += 1
+                frame, offset = parse_frame(view, offset, self.lazy_tables)
+                channel_id, frame_type, payload = frame
+                # pylint: disable=protected-access
+                channel = self.channels[channel_id]
+                if frame_type is FrameType.METHOD:
+                    received = channel._handle_method(payload)
+                elif frame_type is FrameType.CONTENT_HEADER:
+                    received = channel._handle_content_header(payload)
+                elif frame_type is FrameType.CONTENT_BODY:
+                    received = channel._handle_content_body(payload)
+                else:
+                    continue
+                for method in received:
+                    yield channel, method
+        finally:
+            buffer.consume(offset)
+            self._parse_at = len(buffer) + needed if buffer else 0
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        """
+        Return a writable memoryview of the receive buffer to read
+        data into (e.g. with ``socket.recv_into``), so it is not copied.
+        Report how many bytes were read with :meth:`buffer_updated`.
+        """
+        return self._inbound_buffer.get_buffer(
+            max(sizehint, self.bytes_needed)
+        )
+
+    def buffer_updated(self, nbytes: int) -> typing.List[methods.Method]:
+        """
+        Parse ``nbytes`` read into the :meth:`get_buffer` memoryview,
+        the same way :meth:`parse_data` does.
+        """
+        self._inbound_buffer.buffer_updated(nbytes)
+        return self.parse_data(b'')
+
+    @property
+    def parse_pending(self) -> bool:
+        """Tells if the parse budget left complete frames in the buffer.
+        Parse them with ``parse_data(b'')`` or :meth:`iter_events`.
+        """
+        buffered = len(self._inbound_buffer)
+        return bool(buffered) and buffered >= self._parse_at
+
+    @property
+    def bytes_needed(self) -> int:
+        """How many more bytes are needed to complete the frame being
+        received. Zero means there is no partially received frame.
+        """
+        return max(self._parse_at - len(self._inbound_buffer), 0)
 
     def _make_channel(self, channel_id):
         return Channel(channel_id)
@@ -138,13 +231,15 @@ class Connection(BaseChannel):
         channel = self.channels[channel_id] = self._make_channel(channel_id)
         channel.server_settings = self.server_settings
         channel.negotiated_settings = self.negotiated_settings
+        channel.body_type = self.body_type
+        channel.table_cache = self.table_cache
         return channel
 
     def initiate_connection(self):
         """Initiate connection with the server."""
         # pylint: disable=unsubscriptable-object
         self.state = 'opening'
-        self._outbound_buffer.write(
+        self._outbound_buffer.append(
             dump_protocol_header(*self.protocol_version)
         )
 
@@ -227,6 +322,6 @@ class Connection(BaseChannel):
             raise replies.ConnectionForced(
                 f'missed heartbeats from server, timeout: {timeout}s'
             )
-        self._outbound_buffer.write(
+        self._outbound_buffer.append(
             dump_frame_heartbeat(self.channel_id)
         )
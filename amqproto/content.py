@@ -5,14 +5,26 @@ amqproto.content
 AMQP content.
 """
 
+from struct import Struct
+from itertools import repeat
+from operator import attrgetter, itemgetter, is_not
+
 import attr
 
-from .serialization import load, dump
+from .serialization import Codec
+
+_flags = Struct('>H')
+_content_header = Struct('>HHQ')
 
 
 class Properties:
     """
     Base class for content properties.
+
+    Property flags are 16-bit words: every word holds flags for up to 15
+    properties, the lowest bit tells if another flags word follows.
+    In practice only a handful of flag combinations are ever used, so
+    an encoder/decoder is compiled and cached per combination.
     """
     __slots__ = ()
 
@@ -24,38 +36,130 @@ class Properties:
             properties.spec = spec
             properties.class_id = class_id
             properties._field_names = attr.fields_dict(properties).keys()
+            properties._init_names = {
+                field.name for field in attr.fields(properties) if field.init
+            }
+            properties._get_values = staticmethod(
+                attrgetter(*properties._field_names)
+            )
+            # Mappings (flags -> decoder) and (present properties -> encoder).
+            properties._decoders = {}
+            properties._lazy_decoders = {}
+            properties._encoders = {}
             cls.BY_ID[class_id] = properties
             return properties
         return decorator
 
     @classmethod
-    def load(cls, stream):
-        # TODO support for the 16th bit set
-        prop_names = []
-        spec = []
-        flags = load('H', stream)[0]
-        bit = 1 << 15
-        for char, name in zip(cls.spec, cls._field_names):
-            if flags & bit:
-                spec.append(char)
-                prop_names.append(name)
-            bit >>= 1
-        props = load(spec, stream)
-        return cls(**dict(zip(prop_names, props)))
-
-    def dump(self):
-        # TODO support for the 16th bit set
-        spec = ['H']
-        flags = 0
-        props = []
-        for idx, (char, prop_name) in enumerate(
-                zip(self.spec, self._field_names)):
-            prop = getattr(self, prop_name)
-            if prop is not None:
-                spec.append(char)
-                props.append(prop)
-                flags |= 1 << (15 - idx)
-        return dump(spec, flags, *props)
+    def load(cls, buf, offset=0, lazy_tables=False):
+        """Load properties from the content header frame payload.
+
+        :param lazy_tables: load table properties (like headers) as
+            :class:`~amqproto.serialization.LazyTable`.
+        """
+        flags = _flags.unpack_from(buf, offset)[0]
+        offset += 2
+        if flags & 1:
+            flags = [flags]
+            while flags[-1] & 1:
+                flags.append(_flags.unpack_from(buf, offset)[0])
+                offset += 2
+            flags = tuple(flags)
+        decoders = cls._lazy_decoders if lazy_tables else cls._decoders
+        try:
+            names, extra_names, codec = decoders[flags]
+        except KeyError:
+            names, extra_names, codec = _cache(
+                decoders, flags, cls._compile_decoder(flags, lazy_tables),
+            )
+        values = codec.load(buf, offset)[0]
+        if extra_names:
+            return cls._from_values(names, values)
+        return cls(**dict(zip(names, values)))
+
+    @classmethod
+    def _compile_decoder(cls, flags, lazy_tables):
+        if isinstance(flags, int):
+            flags = (flags,)
+        present = [
+            bool(word & (1 << (15 - idx)))
+            for word in flags for idx in range(15)
+        ]
+        names, spec = [], ''
+        for is_present, char, name in zip(present, cls.spec, cls._field_names):
+            if is_present:
+                names.append(name)
+                spec += char
+        extra_names = [name for name in names if name not in cls._init_names]
+        return names, extra_names, Codec(spec, lazy_tables=lazy_tables)
+
+    @classmethod
+    def _from_values(cls, names, values):
+        # Some properties (deprecated ones) are not accepted by __init__.
+        props = dict(zip(names, values))
+        extra = {
+            name: props.pop(name) for name in list(props)
+            if name not in cls._init_names
+        }
+        properties = cls(**props)
+        for name, value in extra.items():
+            setattr(properties, name, value)
+        return properties
+
+    def dump(self, table_cache=None):
+        """Dump properties into the content header frame payload.
+
+        :param table_cache: a :class:`~amqproto.serialization.TableCache`
+            to dump table properties (like headers) with.
+        """
+        values = self._get_values(self)
+        present = tuple(map(is_not, values, _nones))
+        try:
+            flags, codec, select = self._encoders[present]
+        except KeyError:
+            flags, codec, select = _cache(
+                self._encoders, present, self._compile_encoder(present),
+            )
+        return flags + codec.dump(*select(values), table_cache=table_cache)
+
+    @classmethod
+    def _compile_encoder(cls, present):
+        words = []
+        for start in range(0, len(present), 15):
+            word = 0
+            for idx, is_present in enumerate(present[start:start + 15]):
+                if is_present:
+                    word |= 1 << (15 - idx)
+            words.append(word)
+        while len(words) > 1 and not words[-1]:
+            words.pop()
+        flags = b''.join(
+            _flags.pack(word | 1 if idx < len(words) - 1 else word)
+            for idx, word in enumerate(words)
+        )
+        indexes = [idx for idx, is_present in enumerate(present) if is_present]
+        spec = ''.join(cls.spec[idx] for idx in indexes)
+        if len(indexes) == 1:
+            index = indexes[0]
+            select = lambda values: (values[index],)  # noqa
+        elif indexes:
+            select = itemgetter(*indexes)
+        else:
+            select = lambda values: ()  # noqa
+        return flags, Codec(spec), select
+
+
+# A malicious peer can send any flags combination, so the number
+# of cached encoders/decoders per properties class is limited.
+_MAX_CACHED_CODECS = 128
+_nones = repeat(None)
+
+
+def _cache(cache, key, value):
+    if len(cache) >= _MAX_CACHED_CODECS:
+        cache.clear()
+    cache[key] = value
+    return value
 
 
 @attr.s(slots=True)
@@ -92,15 +196,27 @@ class Content:
         return decorator
 
     @classmethod
-    def load(cls, stream):
-        class_id, weight, body_size = load('HHQ', stream)
+    def load(cls, buf, offset=0, lazy_tables=False):
+        """Load a content from the content header frame payload.
+
+        :param lazy_tables: load table properties (like headers) as
+            :class:`~amqproto.serialization.LazyTable`.
+        """
+        class_id, weight, body_size = _content_header.unpack_from(buf, offset)
         assert weight == 0
-        properties = Properties.BY_ID[class_id].load(stream)
+        properties = Properties.BY_ID[class_id].load(
+            buf, offset + 12, lazy_tables,
+        )
         return cls.BY_ID[class_id](b'', body_size, properties)
 
-    def dump(self):
-        header = dump('HHQ', self.class_id, 0, self.body_size)
-        properties = self.properties.dump()
+    def dump(self, table_cache=None):
+        """Dump the content into the content header frame payload.
+
+        :param table_cache: a :class:`~amqproto.serialization.TableCache`
+            to dump table properties (like headers) with.
+        """
+        header = _content_header.pack(self.class_id, 0, self.body_size)
+        properties = self.properties.dump(table_cache)
         return header + properties
 
 
@@ -5,9 +5,15 @@ amqproto.methods
 AMQP methods.
 """
 
+from operator import attrgetter
+from struct import Struct
+
 import attr
 
 
+_method_header = Struct('>HH')
+
+
 @attr.s(slots=True)
 class Method:
     """Describes an AMQP method."""
@@ -24,6 +30,18 @@ class Method:
             method.followed_by_content = 'content' in fields
             method._field_names = fields
 
+            # Compile the spec once, so loading and dumping do not need
+            # to interpret it on every method.
+            method._codec = Codec(spec)
+            method._lazy_codec = (
+                Codec(spec, lazy_tables=True) if 'T' in spec
+                else method._codec
+            )
+            method._header = _method_header.pack(class_id, method_id)
+            method._get_fields = staticmethod(_fields_getter(
+                [field for field in fields if field != 'content']
+            ))
+
             method.responses = set()
             method.response_to = response_to
             if response_to is not None:
@@ -41,16 +59,42 @@ class Method:
         return self.responses and not getattr(self, 'no_wait', False)
 
     @classmethod
-    def load(cls, stream):
+    def load(cls, buf, offset=0, lazy_tables=False):
+        """Load a method from the method frame payload.
+
+        :param lazy_tables: load table fields as
+            :class:`~amqproto.serialization.LazyTable`.
+        """
         if cls is Method:
-            class_id, method_id = load('HH', stream)
-            return cls.BY_ID[(class_id, method_id)].load(stream)
-        return cls(*load(cls.spec, stream))
+            class_id, method_id = _method_header.unpack_from(buf, offset)
+            return cls.BY_ID[(class_id, method_id)].load(
+                buf, offset + 4, lazy_tables,
+            )
+        codec = cls._lazy_codec if lazy_tables else cls._codec
+        return cls(*codec.load(buf, offset)[0])
+
+    def dump(self, table_cache=None):
+        """Dump the method into the method frame payload.
+
+        :param table_cache: a :class:`~amqproto.serialization.TableCache`
+            to dump table fields with.
+        """
+        return self._header + self._codec.dump(
+            *self._get_fields(self), table_cache=table_cache
+        )
 
-    def dump(self):
-        fields = [getattr(self, field) for field in self._field_names
-                  if field != 'content']
-        return dump('HH' + self.spec, self.class_id, self.method_id, *fields)
+
+def _fields_getter(names):
+    if not names:
+        return lambda method: ()
+    if len(names) == 1:
+        getter = attrgetter(names[0])
+        return lambda method: (getter(method),)
+    return attrgetter(*names)
+
+
+# Avoid circular imports problem.
+from .serialization import Codec  # noqa
 
 
 @Method.register(spec='BBTSS', class_id=10, method_id=10)
@@ -558,7 +602,3 @@ class ConfirmSelect(Method):
 @attr.s(slots=True)
 class ConfirmSelectOK(Method):
     pass
-
-
-# Avoid circular imports problem.
-from .serialization import load, dump  # noqa
@@ -231,3 +231,27 @@ class AsynchronousReply(BaseReply):
     """
 
     cause = attr.ib()
+
+
+@attr.s(str=True)
+class MessageNacked(BaseReply):
+    """
+    The server could not take responsibility for a message published
+    with publisher confirms and nacked it.
+    """
+
+    content = attr.ib()
+
+
+@attr.s(str=True)
+class MessageReturned(BaseReply):
+    """
+    The server returned a message published with the mandatory
+    or immediate flag, because it could not route or deliver it.
+    """
+
+    reply_code = attr.ib()
+    reply_text = attr.ib()
+    exchange = attr.ib()
+    routing_key = attr.ib()
+    content = attr.ib()
@@ -3,12 +3,16 @@ from io import BytesIO
 from decimal import Decimal
 from calendar import timegm
 from datetime import datetime
-from struct import pack, unpack, error
-from typing import Iterable, Tuple, Union
+from struct import Struct, pack, unpack, error
+from typing import Iterable, List, Tuple, Union
+from collections import OrderedDict
+from collections.abc import Mapping
 
-__all__ = ['FrameType', 'load', 'parse_protocol_header', 'parse_frames',
-           'dump', 'dump_protocol_header', 'dump_frame_method',
-           'dump_frame_content', 'dump_frame_heartbeat']
+__all__ = ['FrameType', 'Codec', 'LazyTable', 'PreparedTable', 'TableCache',
+           'load', 'parse_protocol_header', 'parse_frames', 'parse_frame',
+           'scan_frame', 'dump', 'dump_protocol_header', 'dump_frame_method',
+           'dump_frame_content', 'dump_frame_content_segments',
+           'dump_frame_body_segments', 'dump_frame_heartbeat']
 
 
 class FrameType(Enum):
@@ -48,16 +52,63 @@ def parse_protocol_header(stream: BytesIO) -> Tuple[int, int, int]:
 def parse_frames(stream: BytesIO) -> Iterable[_Frame]:
     """
     Parse and yield frames from the stream.
-    This function properly handles situations when the data is incomplete,
-    and can raise an exception when parsing fails.
+    This function properly handles situations when the data is incomplete:
+    frames are only decoded when they are received completely, and the
+    stream is left positioned at the first incomplete frame.
+    It can raise an exception when parsing fails.
     """
-    while True:
-        old = stream.tell()
-        try:
-            yield _parse_frame(stream)
-        except IncompleteData as exc:
-            stream.seek(old)
-            break
+    view = memoryview(stream.getvalue())
+    offset = stream.tell()
+    while not scan_frame(view, offset):
+        frame, offset = parse_frame(view, offset)
+        stream.seek(offset)
+        yield frame
+
+
+def scan_frame(view: memoryview, offset: int = 0) -> int:
+    """
+    Check if the buffer holds the whole frame starting at ``offset``
+    without decoding it. Returns how many more bytes are needed to complete
+    the frame, 0 means the frame is complete. If even the frame header
+    is incomplete, the smallest possible number is returned.
+    """
+    available = len(view) - offset
+    if available < 7:
+        return 8 - available
+    length = _frame_length(view, offset + 3)[0]
+    return max(length + 8 - available, 0)
+
+
+def parse_frame(view: memoryview, offset: int = 0,
+                lazy_tables: bool = False) -> Tuple[_Frame, int]:
+    """
+    Parse a frame from the buffer starting at ``offset``, return the frame
+    and the offset of the next one.
+    Nothing is copied out of the buffer: CONTENT_BODY payloads are
+    ``memoryview`` slices of it, so the buffer must not be modified while
+    the payloads are in use.
+    Raises ``IncompleteData`` if the buffer does not hold the whole frame.
+
+    :param lazy_tables: load method table fields and content headers
+        as :class:`LazyTable`.
+    """
+    available = len(view) - offset
+    if available < 7:
+        raise IncompleteData('tried to read 7 bytes, got {} bytes'.format(
+            available
+        ))
+    frame_type, channel_id, length = _frame_header.unpack_from(view, offset)
+    start = offset + 7
+    end = start + length
+    if end >= len(view):
+        raise IncompleteData('tried to read {} bytes, got {} bytes'.format(
+            length + 8, available
+        ))
+    if view[end] != 0xCE:
+        raise error('wrong frame end %r' % view[end:end + 1].tobytes())
+    frame_type = FrameType(frame_type)
+    payload = _load_frame_payload(frame_type, view[start:end], lazy_tables)
+    return (channel_id, frame_type, payload), end + 1
 
 
 def dump_protocol_header(major: int, minor: int, revision: int) -> bytes:
@@ -67,26 +118,65 @@ def dump_protocol_header(major: int, minor: int, revision: int) -> bytes:
     return pack('>5sBBB', b'AMQP\x00', major, minor, revision)
 
 
-def dump_frame_method(channel_id: int, method: 'Method') -> bytes:
+def dump_frame_method(channel_id: int, method: 'Method',
+                      table_cache: 'TableCache' = None) -> bytes:
     """
     Serialize a method frame.
     """
-    return _dump_frame(FrameType.METHOD.value, channel_id, method.dump())
+    return _dump_frame(
+        FrameType.METHOD.value, channel_id, method.dump(table_cache),
+    )
 
 
 def dump_frame_content(channel_id: int, content: 'Content',
-                       max_frame_size: int) -> bytes:
+                       max_frame_size: int,
+                       table_cache: 'TableCache' = None) -> bytes:
     """
     Serialize a content (content header frame + content body frame).
     """
-    buf = bytearray()
-    data = content.dump()
-    buf += _dump_frame(FrameType.CONTENT_HEADER.value, channel_id, data)
-    body = content.body
-    for idx in range(0, content.body_size, max_frame_size):
+    return b''.join(dump_frame_content_segments(
+        channel_id, content, max_frame_size, table_cache,
+    ))
+
+
+def dump_frame_content_segments(
+        channel_id: int, content: 'Content', max_frame_size: int,
+        table_cache: 'TableCache' = None) -> List[bytes]:
+    """
+    Serialize a content into a list of buffer segments suitable for
+    ``writelines``: small frame headers and ``memoryview`` slices of
+    the content body, so the body itself is never copied.
+    """
+    data = content.dump(table_cache)
+    segments = [
+        _dump_frame(FrameType.CONTENT_HEADER.value, channel_id, data)
+    ]
+    segments.extend(dump_frame_body_segments(
+        channel_id, content.body, content.body_size, max_frame_size,
+    ))
+    return segments
+
+
+def dump_frame_body_segments(channel_id: int, body: bytes, body_size: int,
+                             max_frame_size: int) -> List[bytes]:
+    """
+    Serialize a content body into a list of buffer segments: frame
+    headers and ``memoryview`` slices of the body.
+    """
+    segments = []
+    body = memoryview(body)
+    # The frame end octet is merged with the next frame header.
+    frame_start = b''
+    for idx in range(0, body_size, max_frame_size):
         chunk = body[idx:idx + max_frame_size]
-        buf += _dump_frame(FrameType.CONTENT_BODY.value, channel_id, chunk)
-    return bytes(buf)
+        segments.append(frame_start + _frame_header.pack(
+            FrameType.CONTENT_BODY.value, channel_id, len(chunk),
+        ))
+        segments.append(chunk)
+        frame_start = b'\xCE'
+    if frame_start:
+        segments.append(frame_start)
+    return segments
 
 
 def dump_frame_heartbeat(channel_id: int) -> bytes:
@@ -144,12 +234,8 @@ def load(fmt: str, stream: BytesIO, _unpack=unpack):
             timestamp = _unpack('>Q', _read(stream, 8))[0]
             value = datetime.utcfromtimestamp(timestamp)
         elif char == 'T':
-            value = {}
             length = _unpack('>L', _read(stream, 4))[0]
-            stream2 = BytesIO(_read(stream, length))
-            while stream2.tell() < length:
-                key = load('s', stream2)[0]
-                value[key] = _load_item(stream2)
+            value = _load_table_items(_read(stream, length), 0, length)
         elif char != '?':
             raise ValueError('wrong format char', char)
         values.append(value)
@@ -210,11 +296,7 @@ def dump(fmt: str, *values, _pack=pack) -> bytes:
         elif char == 't':
             data = _pack('>Q', timegm(value.utctimetuple()))
         elif char == 'T':
-            stream2 = BytesIO()
-            for key, val in value.items():
-                stream2.write(dump('s', key) + _dump_item(val))
-            payload = stream2.getvalue()
-            data = _pack('>L', len(payload)) + payload
+            data = _dump_table(value)
         elif char != '?':
             raise RuntimeError('should not get there', char)
         buf += data
@@ -223,6 +305,301 @@ def dump(fmt: str, *values, _pack=pack) -> bytes:
     return buf
 
 
+class Codec:
+    """
+    Encoder/decoder for a format (see :func:`load` for valid format chars)
+    compiled once, so that the format is not interpreted on every call.
+
+    Runs of fixed-width fields (including packed bits and timestamps)
+    are fused into a single ``struct.Struct``, strings and tables are
+    handled by specialised steps. The resulting functions are generated
+    the same way ``attrs`` generates ``__init__``.
+
+    ``load(buf, offset=0)`` decodes values from a bytes-like object
+    starting at ``offset`` and returns ``(values, offset)``.
+    ``dump(*values)`` serializes values to bytes.
+
+    :param lazy_tables: load tables as :class:`LazyTable` instead
+        of ``dict``.
+    """
+
+    __slots__ = ('spec', 'load', 'dump')
+
+    def __init__(self, spec: str, lazy_tables: bool = False):
+        self.spec = spec
+        namespace = dict(_CODEC_GLOBALS)
+        if lazy_tables:
+            namespace['_load_table'] = _load_lazy_table
+        source = _compile_codec(spec, namespace)
+        exec(source, namespace)  # pylint: disable=exec-used
+        self.load = namespace['load']
+        self.dump = namespace['dump']
+
+    def __repr__(self):
+        return 'Codec({!r})'.format(self.spec)
+
+
+class LazyTable(Mapping):
+    """
+    Read-only mapping over an encoded field table. Keys are decoded
+    on first access, values are decoded one by one when they are accessed.
+    Dumping a ``LazyTable`` reuses the encoded table as is.
+    Use ``dict(table)`` to get a modifiable copy.
+    """
+
+    __slots__ = ('_data', '_offsets', '_values')
+
+    def __init__(self, data: bytes):
+        self._data = data
+        # Mapping (key -> offset of the encoded value).
+        self._offsets = None
+        # Mapping (key -> value) of already decoded values.
+        self._values = {}
+
+    def _index(self) -> dict:
+        if self._offsets is None:
+            offsets = {}
+            data, offset = self._data, 0
+            while offset < len(data):
+                start = offset + 1
+                offset = start + data[offset]
+                key = str(data[start:offset], 'utf-8', 'surrogatepass')
+                offsets[key] = offset
+                offset = _skip_field_value(data, offset)
+            self._offsets = offsets
+        return self._offsets
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            offset = self._index()[key]
+        value = self._values[key] = _load_field_value(self._data, offset)[0]
+        return value
+
+    def __iter__(self):
+        return iter(self._index())
+
+    def __len__(self):
+        return len(self._index())
+
+    def __repr__(self):
+        return 'LazyTable({!r})'.format(dict(self))
+
+
+class PreparedTable(Mapping):
+    """
+    Immutable field table encoded once. Useful for tables sent over
+    and over, like message headers or declare arguments.
+    """
+
+    __slots__ = ('_table', '_encoded')
+
+    def __init__(self, table):
+        self._table = dict(table)
+        self._encoded = _encode_table(self._table)
+
+    def __getitem__(self, key):
+        return self._table[key]
+
+    def __iter__(self):
+        return iter(self._table)
+
+    def __len__(self):
+        return len(self._table)
+
+    def __repr__(self):
+        return 'PreparedTable({!r})'.format(self._table)
+
+
+# Equal values of these types always have the same encoding, unlike
+# (1,) and (True,), Decimal('1.0') and Decimal('1.00') or 0.0 and -0.0.
+_CACHEABLE_TYPES = frozenset([bool, int, str, bytes, datetime, type(None)])
+
+
+class TableCache:
+    """
+    Bounded LRU cache mapping field tables to their encoded bytes,
+    so tables sent over and over (like message headers or declare
+    arguments) are encoded only once.
+    Only tables of scalar values, which are encoded the same way for
+    all equal values of the same type, are cached; the rest are encoded
+    every time.
+
+    :param maxsize: the maximum number of cached tables.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._tables = OrderedDict()
+
+    def dump(self, table: dict) -> bytes:
+        """Serialize the table, using the cached bytes if possible."""
+        # Value types are a part of the key: True, 1 and 1.0 are equal,
+        # but encoded differently.
+        key = []
+        for name, value in table.items():
+            if value.__class__ not in _CACHEABLE_TYPES:
+                self.misses += 1
+                return _encode_table(table)
+            key.append((name, value.__class__, value))
+        key = tuple(key)
+        try:
+            encoded = self._tables[key]
+        except KeyError:
+            self.misses += 1
+            encoded = self._tables[key] = _encode_table(table)
+            if len(self._tables) > self.maxsize:
+                self._tables.popitem(last=False)
+            return encoded
+        self.hits += 1
+        self._tables.move_to_end(key)
+        return encoded
+
+    def clear(self):
+        """Clear the cache and its counters."""
+        self._tables.clear()
+        self.hits = self.misses = 0
+
+
+_FIXED_WIDTH = {'B': 'B', 'H': 'H', 'L': 'L', 'Q': 'Q', 't': 'Q', '?': 'B'}
+
+
+def _split_spec(spec: str) -> Iterable[str]:
+    run = ''
+    for char in spec:
+        if char in _FIXED_WIDTH:
+            run += char
+            continue
+        if char not in 'sST':
+            raise ValueError('wrong format char', char)
+        if run:
+            yield run
+            run = ''
+        yield char
+    if run:
+        yield run
+
+
+def _compile_codec(spec: str, namespace: dict) -> str:
+    names = ['v%d' % idx for idx in range(len(spec))]
+    values = iter(names)
+    load_lines = []
+    # Fixed-width fields to dump are accumulated and fused into a single
+    # struct, including lengths of the strings.
+    dump_lines, dump_exprs, dump_fmt, dump_args = [], [], '>', []
+
+    def flush_dump_struct():
+        nonlocal dump_fmt, dump_args
+        if dump_args:
+            struct = '_pack%d' % len(dump_exprs)
+            namespace[struct] = Struct(dump_fmt).pack
+            dump_exprs.append('{}({})'.format(struct, ', '.join(dump_args)))
+        dump_fmt, dump_args = '>', []
+
+    for step, chars in enumerate(_split_spec(spec)):
+        if chars in 'sS':
+            name = next(values)
+            if chars == 's':
+                load_lines += [
+                    'start = offset + 1',
+                    'offset = start + buf[offset]',
+                ]
+            else:
+                load_lines += [
+                    'start = offset + 4',
+                    'offset = start + _unpack_long(buf, offset)[0]',
+                ]
+            load_lines.append(
+                '{} = str(buf[start:offset], "utf-8", "surrogatepass")'
+                .format(name)
+            )
+            dump_lines.append(
+                'if {0}.__class__ is str: '
+                '{0} = {0}.encode("utf-8", "surrogatepass")'.format(name)
+            )
+            dump_fmt += 'B' if chars == 's' else 'L'
+            dump_args.append('len({})'.format(name))
+            flush_dump_struct()
+            dump_exprs.append(name)
+        elif chars == 'T':
+            name = next(values)
+            load_lines.append('{}, offset = _load_table(buf, offset)'.format(
+                name
+            ))
+            flush_dump_struct()
+            dump_exprs.append('_dump_table({}, table_cache)'.format(name))
+        else:
+            # A run of fixed-width fields, fused into a single struct.
+            # Consecutive bits are packed into octets, least significant
+            # bit first.
+            fmt, targets, post, args = '>', [], [], []
+            bit = 8
+            for char in chars:
+                name = next(values)
+                if char != '?':
+                    bit = 8
+                    fmt += _FIXED_WIDTH[char]
+                    targets.append(name)
+                    if char == 't':
+                        post.append('{0} = _fromtimestamp({0})'.format(name))
+                        args.append('_timegm({}.utctimetuple())'.format(name))
+                    else:
+                        args.append(name)
+                    continue
+                if bit == 8:
+                    bit = 0
+                    octet = '_octet%d' % len(targets)
+                    fmt += 'B'
+                    targets.append(octet)
+                    args.append([])
+                mask = 1 << bit
+                post.append('{} = ({} & {}) != 0'.format(name, octet, mask))
+                args[-1].append('({} if {} else 0)'.format(mask, name))
+                bit += 1
+            struct = '_struct%d' % step
+            namespace[struct] = Struct(fmt)
+            load_lines.append('{}, = {}.unpack_from(buf, offset)'.format(
+                ', '.join(targets), struct,
+            ))
+            load_lines.append('offset += {}'.format(namespace[struct].size))
+            load_lines += post
+            dump_fmt += fmt[1:]
+            dump_args += [
+                arg if isinstance(arg, str) else ' | '.join(arg)
+                for arg in args
+            ]
+    flush_dump_struct()
+
+    source = ['def load(buf, offset=0):']
+    if load_lines:
+        source.append('    try:')
+        source += ['        ' + line for line in load_lines]
+        source += [
+            '    except IndexError:',
+            '        raise error("not enough data to load {!r}") from None'
+            .format(spec),
+            '    if offset > len(buf):',
+            '        raise error("not enough data to load {!r}")'.format(spec),
+        ]
+    source.append('    return [{}], offset'.format(', '.join(names)))
+    source.append('def dump({}):'.format(
+        ', '.join(names + ['table_cache=None'])
+    ))
+    source += ['    ' + line for line in dump_lines]
+    if not dump_exprs:
+        source.append("    return b''")
+    elif len(dump_exprs) == 1:
+        source.append('    return ' + dump_exprs[0])
+    else:
+        source.append("    return b''.join(({},))".format(
+            ', '.join(dump_exprs)
+        ))
+    return '\n'.join(source)
+
+
 def _read(stream: BytesIO, length: int):
     data = stream.read(length)
     if len(data) != length:
@@ -232,102 +609,200 @@ def _read(stream: BytesIO, length: int):
     return data
 
 
-def _parse_frame(stream: BytesIO, _unpack=unpack):
-    frame_type, channel_id, length = _unpack('>BHL', _read(stream, 7))
-    frame_type = FrameType(frame_type)
-    payload = None
+_frame_header = Struct('>BHL')
+_frame_length = Struct('>L').unpack_from
+
+
+def _load_frame_payload(frame_type: FrameType, payload,
+                        lazy_tables: bool = False):
     if frame_type is FrameType.METHOD:
-        payload = Method.load(stream)
+        return Method.load(payload, lazy_tables=lazy_tables)
     elif frame_type is FrameType.CONTENT_HEADER:
-        payload = Content.load(stream)
-    elif frame_type is FrameType.CONTENT_BODY:
-        payload = _read(stream, length)
+        return Content.load(payload, lazy_tables=lazy_tables)
     elif frame_type is FrameType.HEARTBEAT:
-        pass
-    end = _read(stream, 1)
-    if end != b'\xCE':
-        raise error('wrong frame end %r' % end)
-    return channel_id, frame_type, payload
-
-
-def _load_item(stream: BytesIO, _unpack=unpack):
-    kind = _read(stream, 1)
-    if kind == b't':
-        return _unpack('>?', _read(stream, 1))[0]
-    elif kind == b'b':
-        return _unpack('>b', _read(stream, 1))[0]
-    elif kind == b'B':
-        return _unpack('>B', _read(stream, 1))[0]
-    elif kind == b's':
-        return _unpack('>h', _read(stream, 2))[0]
-    elif kind == b'u':
-        return _unpack('>H', _read(stream, 2))[0]
-    elif kind == b'I':
-        return _unpack('>l', _read(stream, 4))[0]
-    elif kind == b'i':
-        return _unpack('>L', _read(stream, 4))[0]
-    elif kind == b'l':
-        return _unpack('>q', _read(stream, 8))[0]
-    elif kind == b'f':
-        return _unpack('>f', _read(stream, 4))[0]
-    elif kind == b'd':
-        return _unpack('>d', _read(stream, 8))[0]
-    elif kind == b'D':
-        exponent, value = _unpack('>Bl', _read(stream, 5))
-        return Decimal(value) / Decimal(10 ** exponent)
-    elif kind == b'S':
-        return load('S', stream)[0]
-    elif kind == b'A':
-        array = []
-        length = _unpack('>L', _read(stream, 4))[0]
-        start = stream.tell()
-        while stream.tell() - start < length:
-            array.append(_load_item(stream))
-        return array
-    elif kind == b'T':
-        return load('t', stream)[0]
-    elif kind == b'F':
-        return load('T', stream)[0]
-    elif kind == b'V':
         return None
-    elif kind == b'x':
-        length = _unpack('>L', _read(stream, 4))[0]
-        return _read(stream, length)
-    else:
+    return payload
+
+
+_unpack_long = Struct('>L').unpack_from
+
+
+def _load_table(buf, offset: int):
+    start = offset + 4
+    end = start + _unpack_long(buf, offset)[0]
+    if end > len(buf):
+        raise error('not enough data to load a table')
+    return _load_table_items(buf, start, end), end
+
+
+def _load_lazy_table(buf, offset: int):
+    start = offset + 4
+    end = start + _unpack_long(buf, offset)[0]
+    if end > len(buf):
+        raise error('not enough data to load a table')
+    # Copy the table out, so it does not keep the receive buffer alive.
+    return LazyTable(bytes(buf[start:end])), end
+
+
+def _load_table_items(buf, offset: int, end: int) -> dict:
+    table = {}
+    while offset < end:
+        start = offset + 1
+        offset = start + buf[offset]
+        key = str(buf[start:offset], 'utf-8', 'surrogatepass')
+        table[key], offset = _load_field_value(buf, offset)
+    return table
+
+
+def _load_field_value(buf, offset: int):
+    kind = buf[offset]
+    loader = _FIELD_VALUE_LOADERS.get(kind)
+    if loader is None:
+        raise RuntimeError('should not get there', kind)
+    return loader(buf, offset + 1)
+
+
+def _skip_field_value(buf, offset: int) -> int:
+    kind = buf[offset]
+    offset += 1
+    size = _FIELD_VALUE_SIZES.get(kind)
+    if size is not None:
+        return offset + size
+    if kind not in _FIELD_VALUE_LOADERS:
         raise RuntimeError('should not get there', kind)
+    # The rest of the field values are prefixed with their length.
+    return offset + 4 + _unpack_long(buf, offset)[0]
+
+
+def _fixed_field_value_loader(fmt: str):
+    struct = Struct(fmt)
+    unpack_from, size = struct.unpack_from, struct.size
+
+    def loader(buf, offset):
+        return unpack_from(buf, offset)[0], offset + size
+    return loader
+
+
+def _load_decimal(buf, offset: int, _unpack_from=Struct('>Bl').unpack_from):
+    exponent, value = _unpack_from(buf, offset)
+    return Decimal(value) / Decimal(10 ** exponent), offset + 5
+
+
+def _load_longstr(buf, offset: int):
+    start = offset + 4
+    end = start + _unpack_long(buf, offset)[0]
+    return str(buf[start:end], 'utf-8', 'surrogatepass'), end
+
+
+def _load_array(buf, offset: int):
+    array = []
+    start = offset + 4
+    end = start + _unpack_long(buf, offset)[0]
+    while start < end:
+        value, start = _load_field_value(buf, start)
+        array.append(value)
+    return array, end
+
+
+def _load_timestamp(buf, offset: int,
+                    _unpack_from=Struct('>Q').unpack_from):
+    timestamp = _unpack_from(buf, offset)[0]
+    return datetime.utcfromtimestamp(timestamp), offset + 8
+
+
+def _load_bytes(buf, offset: int):
+    start = offset + 4
+    end = start + _unpack_long(buf, offset)[0]
+    return bytes(buf[start:end]), end
+
+
+_FIELD_VALUE_LOADERS = {
+    ord('t'): _fixed_field_value_loader('>?'),
+    ord('b'): _fixed_field_value_loader('>b'),
+    ord('B'): _fixed_field_value_loader('>B'),
+    ord('s'): _fixed_field_value_loader('>h'),
+    ord('u'): _fixed_field_value_loader('>H'),
+    ord('I'): _fixed_field_value_loader('>l'),
+    ord('i'): _fixed_field_value_loader('>L'),
+    ord('l'): _fixed_field_value_loader('>q'),
+    ord('f'): _fixed_field_value_loader('>f'),
+    ord('d'): _fixed_field_value_loader('>d'),
+    ord('D'): _load_decimal,
+    ord('S'): _load_longstr,
+    ord('A'): _load_array,
+    ord('T'): _load_timestamp,
+    ord('F'): _load_table,
+    ord('V'): lambda buf, offset: (None, offset),
+    ord('x'): _load_bytes,
+}
+
+_FIELD_VALUE_SIZES = {
+    ord('t'): 1, ord('b'): 1, ord('B'): 1, ord('s'): 2, ord('u'): 2,
+    ord('I'): 4, ord('i'): 4, ord('l'): 8, ord('f'): 4, ord('d'): 8,
+    ord('D'): 5, ord('T'): 8, ord('V'): 0,
+}
 
 
 def _dump_frame(frame_type: FrameType, channel_id: int, data: bytes) -> bytes:
     return dump('BHL', frame_type, channel_id, len(data)) + data + b'\xCE'
 
 
-def _dump_item(value, _pack=pack) -> bytes:
+def _dump_shortstr(value, _pack=pack) -> bytes:
+    if isinstance(value, str):
+        value = value.encode('utf-8', 'surrogatepass')
+    return _pack('>B', len(value)) + value
+
+
+def _dump_longstr(value, _pack=pack) -> bytes:
+    if isinstance(value, str):
+        value = value.encode('utf-8', 'surrogatepass')
+    return _pack('>L', len(value)) + value
+
+
+def _dump_table(table: dict, table_cache: 'TableCache' = None,
+                _pack=pack) -> bytes:
+    # pylint: disable=protected-access
+    if isinstance(table, PreparedTable):
+        return table._encoded
+    if isinstance(table, LazyTable):
+        return _pack('>L', len(table._data)) + table._data
+    if table_cache is not None:
+        return table_cache.dump(table)
+    return _encode_table(table)
+
+
+def _encode_table(table: dict, _pack=pack) -> bytes:
+    payload = b''.join([
+        _dump_shortstr(key) + _dump_field_value(value)
+        for key, value in table.items()
+    ])
+    return _pack('>L', len(payload)) + payload
+
+
+_INTEGER_KINDS = [
+    (b'b', Struct('>b')), (b'B', Struct('>B')),
+    (b's', Struct('>h')), (b'u', Struct('>H')),
+    (b'I', Struct('>l')), (b'i', Struct('>L')),
+    (b'l', Struct('>q')),
+]
+
+
+def _dump_field_value(value, _pack=pack) -> bytes:
     if isinstance(value, bool):
-        data = b't' + b'\x01' if value else b'\x00'
+        data = b't\x01' if value else b't\x00'
     elif isinstance(value, int):
-        for kind, spec in zip(
-                ('b', 'B', 's', 'u', 'I', 'i', 'l'),
-                ('>B', '>b', '>h', '>H', '>l', '>L', '>q')):
+        for kind, struct in _INTEGER_KINDS:
             try:
-                data = kind + _pack(spec, value)
+                data = kind + struct.pack(value)
                 break
             except error:
                 continue
         else:
             raise ValueError(
-                'cannot _pack {} into amqp integer types'.format(value)
+                'cannot pack {} into amqp integer types'.format(value)
             )
     elif isinstance(value, float):
-        for kind, spec in zip(('f', 'd'), ('>f', '>d')):
-            try:
-                data = kind + _pack(spec, value)
-                break
-            except error:
-                continue
-        else:
-            raise ValueError(
-                'cannot _pack {} into amqp float types'.format(value)
-            )
+        data = _pack('>cd', b'd', value)
     elif isinstance(value, Decimal):
         sign, digits, exponent = value.as_tuple()
         v = 0
@@ -337,26 +812,35 @@ def _dump_item(value, _pack=pack) -> bytes:
             v = -v
         data = _pack('>cBl', b'D', -exponent, v)
     elif isinstance(value, str):
-        data = b'S' + dump('S', value)
+        data = b'S' + _dump_longstr(value)
     elif isinstance(value, (list, tuple)):
-        stream2 = BytesIO
-        for item in value:
-            stream2.write(_dump_item(item))
-        payload = stream2.getvalue()
+        payload = b''.join([_dump_field_value(item) for item in value])
         data = b'A' + _pack('>L', len(payload)) + payload
     elif isinstance(value, datetime):
-        data = b't' + dump('t', value)
-    elif isinstance(value, dict):
-        data = b'F' + dump('T', value)
+        data = _pack('>cQ', b'T', timegm(value.utctimetuple()))
+    elif isinstance(value, (dict, LazyTable, PreparedTable)):
+        data = b'F' + _dump_table(value)
     elif value is None:
         data = b'V'
-    elif isinstance(value, bytes):
-        data = _pack('>L', len(value)) + value
+    elif isinstance(value, (bytes, bytearray)):
+        data = b'x' + _pack('>L', len(value)) + value
     else:
         raise RuntimeError('should not get there', value)
     return data
 
 
+_CODEC_GLOBALS = {
+    'error': error,
+    '_unpack_long': _unpack_long,
+    '_load_table': _load_table,
+    '_dump_shortstr': _dump_shortstr,
+    '_dump_longstr': _dump_longstr,
+    '_dump_table': _dump_table,
+    '_fromtimestamp': datetime.utcfromtimestamp,
+    '_timegm': timegm,
+}
+
+
 # Avoid circular imports problem.
 from .methods import Method  # noqa
 from .content import Content  # noqa
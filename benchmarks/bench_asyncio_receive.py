@@ -0,0 +1,121 @@
+"""
+Compare receiving deliveries with the stream based ``AsyncioConnection``
+and with the ``buffered_protocol=True`` one.
+
+A local server completes the handshake and sends a burst of deliveries
+as soon as a consumer is started.
+
+Run with ``python benchmarks/bench_asyncio_receive.py``.
+"""
+
+import time
+import asyncio
+
+from amqproto import methods
+from amqproto.content import BasicContent
+from amqproto.adapters.asyncio_adapter import AsyncioConnection
+from amqproto.serialization import (
+    FrameType, scan_frame, parse_frame, dump_frame_method, dump_frame_content,
+)
+
+# Receive about the same amount of data for every body size.
+MESSAGES = {16: 100000, 1024: 50000, 16384: 5000}
+FRAME_MAX = 131072
+
+
+def dump(channel_id, method, content=None):
+    data = dump_frame_method(channel_id, method)
+    if content is not None:
+        data += dump_frame_content(channel_id, content, FRAME_MAX - 8)
+    return data
+
+
+def burst(body_size, messages):
+    body = b'x' * body_size
+    return b''.join(
+        dump(1, methods.BasicDeliver(
+            'bench', tag, False, '', 'queue',
+        ), BasicContent(body))
+        for tag in range(1, messages + 1)
+    )
+
+
+def reply(channel_id, method, deliveries):
+    if isinstance(method, methods.ConnectionStartOK):
+        return dump(0, methods.ConnectionTune(0, FRAME_MAX, 0))
+    if isinstance(method, methods.ConnectionOpen):
+        return dump(0, methods.ConnectionOpenOK())
+    if isinstance(method, methods.ConnectionClose):
+        return dump(0, methods.ConnectionCloseOK())
+    if isinstance(method, methods.ChannelOpen):
+        return dump(channel_id, methods.ChannelOpenOK(0))
+    if isinstance(method, methods.ChannelClose):
+        return dump(channel_id, methods.ChannelCloseOK())
+    if isinstance(method, methods.BasicConsume):
+        return dump(
+            channel_id, methods.BasicConsumeOK(method.consumer_tag),
+        ) + deliveries
+    return b''
+
+
+async def serve(deliveries, reader, writer):
+    await reader.readexactly(8)
+    writer.write(dump(0, methods.ConnectionStart(
+        0, 9, {'capabilities': {}}, 'PLAIN', 'en_US',
+    )))
+    data = b''
+    while True:
+        chunk = await reader.read(FRAME_MAX)
+        if not chunk:
+            break
+        data += chunk
+        view = memoryview(data)
+        offset = 0
+        while not scan_frame(view, offset):
+            frame, offset = parse_frame(view, offset)
+            channel_id, frame_type, payload = frame
+            if frame_type is FrameType.METHOD:
+                writer.write(reply(channel_id, payload, deliveries))
+        data = data[offset:]
+        await writer.drain()
+    writer.close()
+
+
+async def receive(port, buffered_protocol, messages):
+    async with AsyncioConnection(
+            port=port, buffered_protocol=buffered_protocol) as connection:
+        async with connection.get_channel() as channel:
+            started = time.perf_counter()
+            await channel.basic_consume(
+                'queue', consumer_tag='bench', no_ack=True,
+            )
+            received = 0
+            async for _ in channel.delivered_messages('bench'):
+                received += 1
+                if received == messages:
+                    break
+            return time.perf_counter() - started
+
+
+async def main():
+    print('{:<12} {:>14} {:>14}'.format('msg/s', 'streams', 'protocol'))
+    for body_size, messages in sorted(MESSAGES.items()):
+        deliveries = burst(body_size, messages)
+        server = await asyncio.start_server(
+            lambda reader, writer: serve(deliveries, reader, writer),
+            '127.0.0.1', 0,
+        )
+        port = server.sockets[0].getsockname()[1]
+        results = [
+            messages / await receive(port, buffered_protocol, messages)
+            for buffered_protocol in (False, True)
+        ]
+        server.close()
+        await server.wait_closed()
+        print('{:<12} {:>14,.0f} {:>14,.0f}'.format(
+            '{} bytes'.format(body_size), *results
+        ))
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,97 @@
+"""
+Compare the spec interpreter (``serialization.load``/``serialization.dump``)
+with the compiled per-spec codecs used by ``Method`` and ``Properties``.
+
+Run with ``python benchmarks/bench_codecs.py``.
+"""
+
+import timeit
+from io import BytesIO
+
+from amqproto import methods
+from amqproto.content import BasicProperties
+from amqproto.serialization import load, dump
+
+NUMBER = 100000
+
+DELIVER = methods.BasicDeliver('ctag', 42, False, 'exchange', 'routing.key')
+PUBLISH = methods.BasicPublish(0, 'exchange', 'routing.key', False, False)
+DECLARE = methods.QueueDeclare(
+    0, 'queue', False, True, False, False, False, {'x-max-length': 1000},
+)
+PROPERTIES = BasicProperties(
+    content_type='application/json', delivery_mode=2,
+    correlation_id='5d0c9c3e', reply_to='amq.rabbitmq.reply-to',
+)
+
+
+def interpreted_load(method, payload):
+    stream = BytesIO(payload)
+    load('HH', stream)
+    return method.__class__(*load(method.spec, stream))
+
+
+def interpreted_dump(method):
+    fields = [getattr(method, field) for field in method._field_names
+              if field != 'content']
+    return dump('HH' + method.spec, method.class_id, method.method_id,
+                *fields)
+
+
+def interpreted_properties_load(cls, payload):
+    stream = BytesIO(payload)
+    prop_names, spec = [], []
+    flags = load('H', stream)[0]
+    bit = 1 << 15
+    for char, name in zip(cls.spec, cls._field_names):
+        if flags & bit:
+            spec.append(char)
+            prop_names.append(name)
+        bit >>= 1
+    return cls(**dict(zip(prop_names, load(spec, stream))))
+
+
+def interpreted_properties_dump(properties):
+    spec, flags, props = ['H'], 0, []
+    for idx, (char, name) in enumerate(
+            zip(properties.spec, properties._field_names)):
+        prop = getattr(properties, name)
+        if prop is not None:
+            spec.append(char)
+            props.append(prop)
+            flags |= 1 << (15 - idx)
+    return dump(spec, flags, *props)
+
+
+def bench(name, interpreted, compiled):
+    old = timeit.timeit(interpreted, number=NUMBER)
+    new = timeit.timeit(compiled, number=NUMBER)
+    print('{:<24} {:>12,.0f} {:>12,.0f} {:>8.1f}x'.format(
+        name, NUMBER / old, NUMBER / new, old / new,
+    ))
+
+
+def main():
+    print('{:<24} {:>12} {:>12} {:>9}'.format(
+        'ops/s', 'interpreted', 'compiled', 'speedup',
+    ))
+    for method in (DELIVER, PUBLISH, DECLARE):
+        payload = method.dump()
+        name = method.__class__.__name__
+        bench(name + '.load',
+              lambda: interpreted_load(method, payload),
+              lambda: methods.Method.load(payload))
+        bench(name + '.dump',
+              lambda: interpreted_dump(method),
+              method.dump)
+    payload = PROPERTIES.dump()
+    bench('BasicProperties.load',
+          lambda: interpreted_properties_load(BasicProperties, payload),
+          lambda: BasicProperties.load(payload))
+    bench('BasicProperties.dump',
+          lambda: interpreted_properties_dump(PROPERTIES),
+          PROPERTIES.dump)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Compare ``Channel.basic_publish`` with publishing through
+``Channel.prepare_publish``: messages serialized per second.
+
+Run with ``python benchmarks/bench_publish.py``.
+"""
+
+import timeit
+
+from amqproto.channel import Channel
+from amqproto.content import BasicContent, BasicProperties
+
+NUMBER = 100000
+
+PROPERTIES = BasicProperties(
+    content_type='application/json', delivery_mode=2, app_id='bench',
+)
+
+
+def bench(name, basic, prepared):
+    old = timeit.timeit(basic, number=NUMBER)
+    new = timeit.timeit(prepared, number=NUMBER)
+    print('{:<24} {:>12,.0f} {:>12,.0f} {:>8.1f}x'.format(
+        name, NUMBER / old, NUMBER / new, old / new,
+    ))
+
+
+def publish(body, confirms):
+    channel = Channel(1)
+    channel.publisher_confirms_active = confirms
+    prepared = channel.prepare_publish('exchange', 'routing.key', PROPERTIES)
+
+    def basic():
+        channel.basic_publish(
+            BasicContent(body, properties=PROPERTIES),
+            'exchange', 'routing.key',
+        )
+        channel.segments_to_send()
+
+    def prepare():
+        prepared.publish(body)
+        channel.segments_to_send()
+
+    return basic, prepare
+
+
+def main():
+    print('{:<24} {:>12} {:>12} {:>9}'.format(
+        'msg/s', 'basic', 'prepared', 'speedup',
+    ))
+    for size in (16, 1024, 256 * 1024):
+        body = b'x' * size
+        bench('{} bytes'.format(size), *publish(body, confirms=False))
+        bench('{} bytes, confirms'.format(size), *publish(body, confirms=True))
+
+
+if __name__ == '__main__':
+    main()
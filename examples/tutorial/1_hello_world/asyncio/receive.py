@@ -11,9 +11,10 @@ async def main():
             async with connection.get_channel() as channel:
                 await channel.queue_declare('hello')
 
-                await channel.basic_consume('hello', no_ack=True)
+                consumer = await channel.basic_consume('hello', no_ack=True)
                 print(' [*] Waiting for messages. To exit press CTRL+C')
-                async with aclosing(channel.delivered_messages()) as messages:
+                messages = channel.delivered_messages(consumer.consumer_tag)
+                async with aclosing(messages):
                     async for message in messages:
                         print(" [x] Received %r" % message.body)
     except asyncio.CancelledError:
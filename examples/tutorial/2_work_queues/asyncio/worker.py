@@ -13,10 +13,11 @@ async def main():
                 await channel.queue_declare('task_queue', durable=True)
 
                 await channel.basic_qos(prefetch_count=1)
-                await channel.basic_consume('task_queue')
+                consumer = await channel.basic_consume('task_queue')
                 print(' [x] Waiting for messages. To exit press CTRL+C')
 
-                async with aclosing(channel.delivered_messages()) as messages:
+                messages = channel.delivered_messages(consumer.consumer_tag)
+                async with aclosing(messages):
                     async for message in messages:
                         body = message.body.decode('utf-8')
                         to_sleep = body.count('.')
@@ -14,10 +14,13 @@ async def main():
                 reply = await channel.queue_declare('', exclusive=True)
                 await channel.queue_bind(reply.queue, exchange='logs')
 
-                await channel.basic_consume(reply.queue, no_ack=True)
+                consumer = await channel.basic_consume(
+                    reply.queue, no_ack=True,
+                )
                 print(' [x] Waiting for logs. To exit press CTRL+C')
 
-                async with aclosing(channel.delivered_messages()) as messages:
+                messages = channel.delivered_messages(consumer.consumer_tag)
+                async with aclosing(messages):
                     async for message in messages:
                         print(" [x] Received %r" % message.body.decode('utf-8'))
     except asyncio.CancelledError:
@@ -27,10 +27,11 @@ async def main():
                         routing_key=severity,
                     )
 
-                await channel.basic_consume(queue_name, no_ack=True)
+                consumer = await channel.basic_consume(queue_name, no_ack=True)
                 print(' [x] Waiting for logs. To exit press CTRL+C')
 
-                async with aclosing(channel.delivered_messages()) as messages:
+                messages = channel.delivered_messages(consumer.consumer_tag)
+                async with aclosing(messages):
                     async for message in messages:
                         body = message.body.decode('utf-8')
                         severity = message.delivery_info.routing_key
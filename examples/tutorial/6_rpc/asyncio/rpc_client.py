@@ -14,7 +14,9 @@ class FibonacciRpcClient:
 
     async def __aenter__(self):
         self.reply_queue = await self.channel.queue_declare('', exclusive=True)
-        await self.channel.basic_consume(self.reply_queue.queue, no_ack=True)
+        self.consumer = await self.channel.basic_consume(
+            self.reply_queue.queue, no_ack=True,
+        )
         return self
 
     async def __aexit__(self, *_):
@@ -32,7 +34,10 @@ class FibonacciRpcClient:
         await self.channel.basic_publish(
             message, exchange='', routing_key='rpc_queue',
         )
-        async with aclosing(self.channel.delivered_messages()) as messages:
+        messages = self.channel.delivered_messages(
+            self.consumer.consumer_tag,
+        )
+        async with aclosing(messages):
             async for reply in messages:
                 if correlation_id == reply.correlation_id:
                     return int(reply.body.decode('utf-8'))
@@ -23,10 +23,11 @@ async def main():
                 await channel.queue_declare('rpc_queue', durable=True)
 
                 await channel.basic_qos(prefetch_count=1)
-                await channel.basic_consume('rpc_queue')
+                consumer = await channel.basic_consume('rpc_queue')
                 print(' [x] Waiting for messages. To exit press CTRL+C')
 
-                async with aclosing(channel.delivered_messages()) as messages:
+                messages = channel.delivered_messages(consumer.consumer_tag)
+                async with aclosing(messages):
                     async for message in messages:
                         body = message.body.decode('utf-8')
                         n = int(body)
@@ -3,7 +3,7 @@ import asyncio
 import pytest
 import requests
 
-from amqproto import BaseReply
+from amqproto import BaseReply, AsynchronousReply, MessageReturned
 from amqproto.methods import BasicDeliver, BasicReturn
 from amqproto.adapters.asyncio_adapter import AsyncioConnection
 
@@ -106,7 +106,7 @@ async def test_can_produce_and_consume_messages(channel):
     message = b'hello world'
     await channel.basic_publish(message, exchange='', routing_key='hello')
 
-    async for message in channel.delivered_messages():
+    async for message in channel.delivered_messages(consumer_tag):
         assert message.body == b'hello world'
         assert isinstance(message.delivery_info, BasicDeliver)
         assert message.delivery_info.routing_key == 'hello'
@@ -114,7 +114,7 @@ async def test_can_produce_and_consume_messages(channel):
         await channel.basic_ack(message.delivery_info.delivery_tag)
         break
 
-    assert channel._delivered_messages.empty()
+    assert channel._delivered_messages[consumer_tag].empty()
 
     await channel.basic_cancel(consumer_tag)
 
@@ -131,12 +131,12 @@ async def test_mandatory_flag_handles_undelivered_messages(channel):
         routing_key='foobar',  # this queue doesnt exist
         mandatory=True,
     )
-    async for message in channel.delivered_messages():
+    async for message in channel.returned_messages():
         assert message.body == message.body
         assert isinstance(message.delivery_info, BasicReturn)
         break
 
-    assert channel._delivered_messages.empty()
+    assert channel._returned_messages.empty()
 
     await channel.exchange_delete(exchange_name)
 
@@ -155,7 +155,7 @@ async def test_mandatory_flag_on_existing_queue(channel):
     # Make sure there are no dangling messages in the queue
     response = await channel.basic_get(queue_name)
     assert response.content.body == message
-    assert channel._delivered_messages.empty()
+    assert channel._returned_messages.empty()
 
     # cleanup
     await channel.queue_unbind(queue_name, exchange_name)
@@ -174,3 +174,196 @@ async def test_heartbeats():
     async with AsyncioConnection(heartbeat=1) as conn:
         async with conn.get_channel():
             await asyncio.sleep(2)
+
+
+@pytest.mark.asyncio()
+async def test_buffered_protocol():
+    async with AsyncioConnection(buffered_protocol=True) as conn:
+        async with conn.get_channel() as channel:
+            await channel.queue_declare('hello')
+            message = b'hello world'
+            await channel.basic_publish(message, routing_key='hello')
+            response = await channel.basic_get('hello')
+            assert response.content.body == message
+
+
+@pytest.mark.asyncio()
+async def test_concurrent_publishes_are_coalesced(connection):
+    queue_name = 'amqproto_test_q'
+    async with connection.get_channel() as channel:
+        await channel.queue_declare(queue_name)
+        await asyncio.gather(*(
+            channel.basic_publish(b'%d' % idx, routing_key=queue_name)
+            for idx in range(100)
+        ))
+        bodies = set()
+        for _ in range(100):
+            response = await channel.basic_get(queue_name, no_ack=True)
+            bodies.add(response.content.body)
+        assert bodies == {b'%d' % idx for idx in range(100)}
+        await channel.queue_delete(queue_name)
+
+
+@pytest.mark.asyncio()
+async def test_channel_errors_fail_later_calls(connection):
+    channel = connection.get_channel()
+    await channel.open()
+    with pytest.raises(BaseReply):
+        await channel.queue_declare('amqproto_missing_q', passive=True)
+    with pytest.raises(AsynchronousReply):
+        await channel.queue_declare('amqproto_test_q')
+
+
+@pytest.mark.asyncio()
+async def test_response_timeout(connection):
+    async with connection.get_channel() as channel:
+        channel.response_timeout = 5
+        await channel.queue_declare('amqproto_test_q')
+        await channel.queue_delete('amqproto_test_q')
+
+
+@pytest.mark.asyncio()
+async def test_pipeline(connection):
+    names = ['amqproto_test_q{}'.format(idx) for idx in range(100)]
+    async with connection.get_channel() as channel:
+        async with channel.pipeline():
+            declares = [await channel.queue_declare(name) for name in names]
+        assert [declare.result().queue for declare in declares] == names
+        responses = await asyncio.gather(*(
+            channel.queue_delete(name) for name in names
+        ))
+        assert len(responses) == len(names)
+
+
+@pytest.mark.asyncio()
+async def test_pipeline_errors_are_attributed(connection):
+    channel = connection.get_channel()
+    await channel.open()
+    responses = []
+    with pytest.raises(BaseReply):
+        async with channel.pipeline():
+            responses.append(await channel.queue_declare('amqproto_test_q'))
+            responses.append(await channel.queue_declare(
+                'amqproto_missing_q', passive=True,
+            ))
+            responses.append(await channel.queue_declare('amqproto_test_q'))
+    assert responses[0].result().queue == 'amqproto_test_q'
+    assert not isinstance(responses[1].exception(), AsynchronousReply)
+    assert isinstance(responses[2].exception(), AsynchronousReply)
+
+
+@pytest.mark.asyncio()
+async def test_channels_opened_with_connection():
+    connection = AsyncioConnection()
+    channels = [connection.get_channel() for _ in range(3)]
+    async with connection:
+        assert all(channel.state == 'open' for channel in channels)
+        channel = connection.get_channel()
+        await channel.open(wait=False)
+        await channel.basic_qos(prefetch_count=10)
+        assert channel.state == 'open'
+
+
+@pytest.mark.asyncio()
+async def test_bulk_open_and_close_channels():
+    async with AsyncioConnection() as connection:
+        channels = await connection.open_channels(100)
+        assert all(channel.state == 'open' for channel in channels)
+        await connection.close_channels()
+        assert all(channel.state == 'closed' for channel in channels)
+        channels = await connection.open_channels(100)
+        await connection.close(timeout=10)
+    assert all(channel.state == 'closed' for channel in channels)
+
+
+@pytest.mark.asyncio()
+async def test_publisher_confirms(connection):
+    queue_name = 'amqproto_test_q'
+    async with connection.get_channel() as channel:
+        channel.max_unconfirmed = 10
+        await channel.confirm_select()
+        await channel.queue_declare(queue_name)
+        confirm = await channel.basic_publish(b'body', routing_key=queue_name)
+        await confirm
+        for _ in range(100):
+            await channel.basic_publish(b'body', routing_key=queue_name)
+            assert channel._unconfirmed_count <= 10
+        await channel.wait_for_confirms()
+        confirm = await channel.basic_publish(
+            b'body', routing_key='amqproto_missing_q', mandatory=True,
+        )
+        with pytest.raises(MessageReturned):
+            await confirm
+        await channel.queue_delete(queue_name)
+
+
+@pytest.mark.asyncio()
+async def test_batched_acks(connection):
+    queue_name = 'amqproto_test_q'
+    async with connection.get_channel() as channel:
+        channel.ack_batch_size = 10
+        await channel.queue_declare(queue_name)
+        for idx in range(25):
+            await channel.basic_publish(b'%d' % idx, routing_key=queue_name)
+        reply = await channel.basic_consume(queue_name)
+        received = 0
+        async for message in channel.delivered_messages(reply.consumer_tag):
+            await channel.basic_ack(message.delivery_info.delivery_tag)
+            received += 1
+            if received == 25:
+                break
+        await asyncio.sleep(channel.ack_flush_interval * 2)
+        assert not channel._pending_acks
+        response = await channel.queue_delete(queue_name)
+        assert response.message_count == 0
+
+
+@pytest.mark.asyncio()
+async def test_consumers_have_own_queues(channel):
+    queue_names = ['amqproto_test_q1', 'amqproto_test_q2']
+    for queue_name in queue_names:
+        await channel.queue_declare(queue_name)
+        await channel.basic_consume(
+            queue_name, consumer_tag=queue_name, no_ack=True,
+        )
+        for idx in range(10):
+            await channel.basic_publish(b'%d' % idx, routing_key=queue_name)
+    # Messages of the second consumer don't wait for the first one.
+    async for message in channel.delivered_messages(queue_names[1]):
+        assert message.delivery_info.consumer_tag == queue_names[1]
+        break
+    for queue_name, left in zip(queue_names, [10, 9]):
+        received = 0
+        async for message in channel.delivered_messages(queue_name):
+            received += 1
+            if received == left:
+                # Iteration ends once the consumer is cancelled.
+                await channel.basic_cancel(queue_name)
+        assert received == left
+        await channel.queue_delete(queue_name)
+    assert channel._delivered_messages == {}
+
+
+@pytest.mark.asyncio()
+async def test_bounded_delivery_buffers():
+    queue_name = 'amqproto_test_bounded'
+    async with AsyncioConnection(max_buffered_messages=10) as connection:
+        async with connection.get_channel() as channel:
+            await channel.queue_declare(queue_name)
+            for idx in range(100):
+                await channel.basic_publish(
+                    b'%d' % idx, routing_key=queue_name,
+                )
+            reply = await channel.basic_consume(queue_name, no_ack=True)
+            await asyncio.sleep(0.5)
+            # Receiving pauses once more than 10 messages are buffered.
+            assert connection._budget.messages == 11
+            received = 0
+            async for message in channel.delivered_messages(
+                    reply.consumer_tag):
+                assert connection._budget.messages <= 11
+                received += 1
+                if received == 100:
+                    break
+            assert connection._budget.messages == 0
+            await channel.queue_delete(queue_name)
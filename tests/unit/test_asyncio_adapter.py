@@ -0,0 +1,355 @@
+import asyncio
+
+import pytest
+
+from amqproto import methods
+from amqproto.adapters.asyncio_adapter import (
+    AsyncioConnection, _AsyncioProtocol, _CoalescingWriter,
+)
+from amqproto.content import BasicContent
+from amqproto.replies import ChannelError, MessageReturned
+from amqproto.serialization import dump_frame_method, dump_frame_content
+
+
+class FakeTransport:
+
+    def __init__(self):
+        self.written = []
+        self.reading = True
+        self.closing = False
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+    def writelines(self, segments):
+        self.written.extend(bytes(segment) for segment in segments)
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+    def is_closing(self):
+        return self.closing
+
+    def close(self):
+        self.closing = True
+
+
+@pytest.fixture
+def protocol():
+    connection = AsyncioConnection(buffered_protocol=True)
+    protocol = _AsyncioProtocol(connection)
+    protocol.connection_made(FakeTransport())
+    # pylint: disable=protected-access
+    connection._writer = _CoalescingWriter(protocol, flush_threshold=1024)
+    connection.state = 'open'
+    return protocol
+
+
+async def open_channel(protocol):
+    """Open a channel of the protocol connection, with the server
+    responding ChannelOpenOK.
+    """
+    connection = protocol._connection
+    asyncio.ensure_future(connection._dispatch_received())
+    channel = connection.get_channel()
+    opened = channel._open()
+    protocol.data_received(dump_frame_method(
+        channel.channel_id, methods.ChannelOpenOK(0),
+    ))
+    await opened
+    return channel
+
+
+@pytest.mark.asyncio()
+async def test_drain_waits_for_resume_writing(protocol):
+    writer = protocol._connection._writer
+    await asyncio.wait_for(writer.drain(), 1)
+    protocol.pause_writing()
+    drain = asyncio.ensure_future(writer.drain())
+    await asyncio.sleep(0.01)
+    assert not drain.done()
+    protocol.resume_writing()
+    await asyncio.wait_for(drain, 1)
+
+
+@pytest.mark.asyncio()
+async def test_drain_yields_to_event_loop(protocol):
+    writer = protocol._connection._writer
+    ran = []
+    asyncio.get_event_loop().call_soon(ran.append, True)
+    # The first flush is scheduled, the second one happens before
+    # the event loop runs.
+    writer.writelines([b'x' * 512])
+    writer.writelines([b'x' * 512])
+    assert b''.join(protocol.transport.written) == b'x' * 1024
+    await writer.drain()
+    assert ran == [True]
+
+
+@pytest.mark.asyncio()
+async def test_receive_while_writing_paused(protocol):
+    connection = protocol._connection
+    dispatch = asyncio.ensure_future(connection._dispatch_received())
+    channel = connection.get_channel()
+    opened = channel._open()
+    protocol.pause_writing()
+    drain = asyncio.ensure_future(connection._writer.drain())
+    protocol.data_received(dump_frame_method(
+        channel.channel_id, methods.ChannelOpenOK(0),
+    ))
+    await asyncio.wait_for(opened, 1)
+    assert channel.state == 'open'
+    assert not drain.done()
+    protocol.resume_writing()
+    await asyncio.wait_for(drain, 1)
+    connection.state = 'closed'
+    protocol.connection_lost(None)
+    await asyncio.wait_for(dispatch, 1)
+
+
+def returned(channel, body):
+    return dump_frame_method(channel.channel_id, methods.BasicReturn(
+        312, 'NO_ROUTE', '', 'nowhere',
+    )) + dump_frame_content(channel.channel_id, BasicContent(body), 1024)
+
+
+@pytest.mark.asyncio()
+@pytest.mark.parametrize('returned_first', [False, True])
+async def test_returns_match_confirms_of_equal_bodies(
+        protocol, returned_first):
+    channel = await open_channel(protocol)
+    channel.publisher_confirms_active = True
+    publishes = [
+        channel.basic_publish(b'same', routing_key='queue'),
+        channel.basic_publish(b'same', routing_key='nowhere', mandatory=True),
+    ]
+    if returned_first:
+        publishes.reverse()
+    confirms = [await publish for publish in publishes]
+    if returned_first:
+        confirms.reverse()
+    routed, unroutable = confirms
+    protocol.data_received(
+        returned(channel, b'same') +
+        dump_frame_method(channel.channel_id, methods.BasicAck(2, True))
+    )
+    assert await asyncio.wait_for(routed, 1) is None
+    with pytest.raises(MessageReturned):
+        await asyncio.wait_for(unroutable, 1)
+
+
+@pytest.mark.asyncio()
+async def test_returns_match_confirms_of_mandatory_publishes(protocol):
+    channel = await open_channel(protocol)
+    channel.publisher_confirms_active = True
+    unroutable = await channel.basic_publish(
+        b'body', routing_key='nowhere', mandatory=True,
+    )
+    routed = await channel.basic_publish(
+        b'body', routing_key='queue', mandatory=True,
+    )
+    protocol.data_received(
+        returned(channel, b'body') +
+        dump_frame_method(channel.channel_id, methods.BasicAck(2, True))
+    )
+    with pytest.raises(MessageReturned):
+        await asyncio.wait_for(unroutable, 1)
+    assert await asyncio.wait_for(routed, 1) is None
+
+
+@pytest.mark.asyncio()
+async def test_returns_with_confirms_arent_buffered(protocol):
+    channel = await open_channel(protocol)
+    channel.max_buffered_messages = 2
+    channel.publisher_confirms_active = True
+    confirms = []
+    for tag in range(1, 5):
+        confirms.append(await channel.basic_publish(
+            b'body', routing_key='nowhere', mandatory=True,
+        ))
+        protocol.data_received(
+            returned(channel, b'body') +
+            dump_frame_method(channel.channel_id, methods.BasicAck(tag, False))
+        )
+    for confirm in confirms:
+        with pytest.raises(MessageReturned):
+            await asyncio.wait_for(confirm, 1)
+    assert channel._buffered_messages == 0
+
+
+@pytest.mark.asyncio()
+async def test_wait_for_confirms_timeout_keeps_confirms(protocol):
+    channel = await open_channel(protocol)
+    channel.publisher_confirms_active = True
+    channel.response_timeout = 0.01
+    confirm = await channel.basic_publish(b'body', routing_key='queue')
+    with pytest.raises(asyncio.TimeoutError):
+        await channel.wait_for_confirms()
+    assert not confirm.done()
+    protocol.data_received(
+        dump_frame_method(channel.channel_id, methods.BasicAck(1, False))
+    )
+    assert await asyncio.wait_for(confirm, 1) is None
+
+
+@pytest.mark.asyncio()
+async def test_failed_publish_is_not_confirmed(protocol):
+    channel = await open_channel(protocol)
+    channel.publisher_confirms_active = True
+    channel.state = 'closed'
+    with pytest.raises(ChannelError):
+        await channel.basic_publish(b'body', routing_key='queue')
+    await asyncio.wait_for(channel.wait_for_confirms(), 1)
+    assert channel._unconfirmed_count == 0
+    assert channel._next_delivery_tag == 1
+
+
+def deliver(channel, consumer_tag, delivery_tag, body):
+    return dump_frame_method(channel.channel_id, methods.BasicDeliver(
+        consumer_tag, delivery_tag, False, '', 'queue',
+    )) + dump_frame_content(channel.channel_id, BasicContent(body), 1024)
+
+
+async def consume(protocol, channel, consumer_tag, messages):
+    consuming = asyncio.ensure_future(
+        channel.basic_consume('queue', consumer_tag=consumer_tag),
+    )
+    protocol.data_received(dump_frame_method(
+        channel.channel_id, methods.BasicConsumeOK(consumer_tag),
+    ) + b''.join(
+        deliver(channel, consumer_tag, tag, b'body')
+        for tag in range(1, messages + 1)
+    ))
+    await asyncio.wait_for(consuming, 1)
+
+
+@pytest.mark.asyncio()
+async def test_cancelled_consumer_queue_is_removed(protocol):
+    channel = await open_channel(protocol)
+    await consume(protocol, channel, 'ctag', 3)
+    protocol.data_received(dump_frame_method(
+        channel.channel_id, methods.BasicCancel('ctag', True),
+    ))
+    await asyncio.sleep(0)
+    assert channel._delivered_messages == {}
+    assert [message async for message in
+            channel.delivered_messages('ctag')] == []
+    assert channel._delivered_messages == {}
+
+
+@pytest.mark.asyncio()
+async def test_cancelled_consumer_iteration_ends(protocol):
+    channel = await open_channel(protocol)
+    await consume(protocol, channel, 'ctag', 3)
+    received = []
+    async for message in channel.delivered_messages('ctag'):
+        received.append(message)
+        if len(received) == 1:
+            cancelling = asyncio.ensure_future(channel.basic_cancel('ctag'))
+            await asyncio.sleep(0)
+            protocol.data_received(dump_frame_method(
+                channel.channel_id, methods.BasicCancelOK('ctag'),
+            ))
+            await asyncio.wait_for(cancelling, 1)
+    assert len(received) == 3
+    assert channel._delivered_messages == {}
+
+
+@pytest.mark.asyncio()
+async def test_cancelled_consumer_leaves_budget(protocol):
+    budget = protocol._connection._budget
+    budget.max_messages = 10
+    channel = await open_channel(protocol)
+    await consume(protocol, channel, 'first', 30)
+    await asyncio.sleep(0)
+    # Receiving pauses once more than 10 messages are buffered.
+    assert budget.messages == 11
+    assert budget.paused
+    cancelling = asyncio.ensure_future(channel.basic_cancel('first'))
+    await asyncio.sleep(0)
+    protocol.data_received(dump_frame_method(
+        channel.channel_id, methods.BasicCancelOK('first'),
+    ))
+    await asyncio.wait_for(cancelling, 1)
+    assert budget.messages == 0
+    assert not budget.paused
+
+    await consume(protocol, channel, 'second', 3)
+    received = []
+    async for message in channel.delivered_messages('second'):
+        received.append(message)
+        if len(received) == 3:
+            break
+    assert budget.messages == 0
+
+
+@pytest.mark.asyncio()
+async def test_consume_while_waiting_for_confirms(protocol):
+    budget = protocol._connection._budget
+    budget.max_messages = 10
+    channel = await open_channel(protocol)
+    channel.publisher_confirms_active = True
+    confirm = await channel.basic_publish(b'body', routing_key='queue')
+    await consume(protocol, channel, 'ctag', 30)
+    protocol.data_received(
+        dump_frame_method(channel.channel_id, methods.BasicAck(1, False))
+    )
+    async for message in channel.delivered_messages('ctag'):
+        assert message.body == b'body'
+        break
+    # The ack comes after the deliveries.
+    assert await asyncio.wait_for(confirm, 1) is None
+
+
+@pytest.mark.asyncio()
+async def test_heartbeats_not_missed_while_paused(protocol):
+    connection = protocol._connection
+    connection._budget.max_messages = 10
+    channel = await open_channel(protocol)
+    await consume(protocol, channel, 'ctag', 30)
+    assert connection._budget.paused
+    connection.negotiated_settings.heartbeat = 0.01
+    heartbeat = asyncio.ensure_future(connection._start_heartbeat())
+    await asyncio.sleep(0.1)
+    assert not heartbeat.done()
+    heartbeat.cancel()
+
+
+@pytest.mark.asyncio()
+async def test_pipeline_is_scoped_to_task(protocol):
+    channel = await open_channel(protocol)
+    async with channel.pipeline():
+        pipelined = await channel.queue_declare('first')
+        declaring = asyncio.ensure_future(channel.queue_declare('second'))
+        await asyncio.sleep(0)
+        protocol.data_received(b''.join(
+            dump_frame_method(channel.channel_id, methods.QueueDeclareOK(
+                name, 0, 0,
+            ))
+            for name in ('first', 'second')
+        ))
+        declared = await asyncio.wait_for(declaring, 1)
+    assert declared.queue == 'second'
+    assert pipelined.result().queue == 'first'
+
+
+@pytest.mark.asyncio()
+async def test_delivered_messages_of_all_consumers(protocol):
+    channel = await open_channel(protocol)
+    await consume(protocol, channel, 'first', 2)
+    await consume(protocol, channel, 'second', 3)
+    received = []
+    async for message in channel.delivered_messages():
+        received.append(message.delivery_info.consumer_tag)
+        if len(received) == 4:
+            break
+    assert received == ['first', 'first', 'second', 'second']
+    # The message left once nobody iterates over all consumers goes
+    # back to its consumer.
+    async for message in channel.delivered_messages('second'):
+        assert message.delivery_info.delivery_tag == 3
+        break
+    assert protocol._connection._budget.messages == 0
@@ -0,0 +1,45 @@
+from amqproto.buffer import ReceiveBuffer
+
+
+def test_write_and_consume():
+    buffer = ReceiveBuffer(size=16)
+    assert not buffer
+    buffer.write(b'hello')
+    buffer.write(b' world')
+    assert len(buffer) == 11
+    assert buffer.view() == b'hello world'
+    buffer.consume(6)
+    assert buffer.view() == b'world'
+
+
+def test_get_buffer():
+    buffer = ReceiveBuffer(size=16)
+    view = buffer.get_buffer(4)
+    assert len(view) >= 4
+    view[:4] = b'data'
+    buffer.buffer_updated(4)
+    assert buffer.view() == b'data'
+
+
+def test_consumed_data_is_not_overwritten():
+    buffer = ReceiveBuffer(size=16, compact_threshold=8)
+    buffer.write(b'x' * 10)
+    consumed = buffer.view()[:10]
+    buffer.consume(10)
+    buffer.write(b'y' * 12)
+    assert consumed == b'x' * 10
+    assert buffer.view() == b'y' * 12
+
+
+def test_compact_and_grow():
+    buffer = ReceiveBuffer(size=16, compact_threshold=8)
+    buffer.write(b'x' * 12)
+    buffer.consume(10)
+    # The consumed prefix passed the threshold: compacted.
+    buffer.write(b'y' * 8)
+    assert buffer.view() == b'xx' + b'y' * 8
+    assert len(buffer._buffer) == 16
+    # Not enough data is consumed: grown.
+    buffer.write(b'z' * 8)
+    assert buffer.view() == b'xx' + b'y' * 8 + b'z' * 8
+    assert len(buffer._buffer) > 16
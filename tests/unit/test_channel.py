@@ -0,0 +1,201 @@
+import pytest
+
+from amqproto import methods
+from amqproto.content import BasicContent, BasicProperties
+from amqproto.channel import Channel
+from amqproto.connection import Connection
+from amqproto.serialization import dump_frame_method
+
+
+def test_publish_segments_do_not_copy_body():
+    channel = Channel(1)
+    body = b'x' * 10000
+    channel.basic_publish(body, routing_key='queue')
+    segments = channel.segments_to_send()
+    body_segments = [
+        segment for segment in segments
+        if isinstance(segment, memoryview) and segment.obj is body
+    ]
+    assert b''.join(body_segments) == body
+    assert channel.segments_to_send() == []
+
+    channel.basic_publish(body, routing_key='queue')
+    assert channel.data_to_send() == b''.join(segments)
+
+
+def test_publish_roundtrip():
+    channel = Channel(1)
+    body = bytes(range(256)) * 100
+    channel.basic_publish(body, exchange='exchange', routing_key='queue')
+    channel.basic_publish(b'', exchange='exchange', routing_key='queue')
+    data = channel.data_to_send()
+
+    connection = Connection()
+    connection.get_channel(1)
+    received = connection.parse_data(data)[1]
+    assert [method.__class__ for method in received] == [
+        methods.BasicPublish, methods.BasicPublish,
+    ]
+    assert received[0].content.body == body
+    assert received[0].routing_key == 'queue'
+    assert received[1].content.body == b''
+
+
+@pytest.mark.parametrize('body', [b'', b'body', bytes(range(256)) * 100])
+def test_prepared_publish_is_the_same_as_basic_publish(body):
+    properties = BasicProperties(content_type='text/plain', delivery_mode=2)
+    channel = Channel(1)
+    channel.basic_publish(
+        BasicContent(body, properties=properties),
+        exchange='exchange', routing_key='queue', mandatory=True,
+    )
+    expected = channel.data_to_send()
+
+    prepared = channel.prepare_publish(
+        'exchange', 'queue', properties, mandatory=True,
+    )
+    prepared.publish(body)
+    assert channel.data_to_send() == expected
+    channel.publish_prepared(prepared, body)
+    assert channel.data_to_send() == expected
+
+
+def test_prepared_publish_tracks_confirms():
+    channel = Channel(1)
+    channel.publisher_confirms_active = True
+    prepared = channel.prepare_publish(routing_key='queue')
+    prepared.publish(b'first')
+    prepared.publish(b'second')
+    assert [
+        content.body for content in channel._unconfirmed_messages
+    ] == [b'first', b'second']
+    assert channel._next_delivery_tag == 3
+
+
+def test_prepared_publish_for_another_channel():
+    prepared = Channel(1).prepare_publish(routing_key='queue')
+    with pytest.raises(ValueError):
+        Channel(2).publish_prepared(prepared, b'body')
+
+
+def test_publish_multi():
+    targets = [('exchange', 'first'), ('exchange', 'second'), ('', 'third')]
+    body = bytes(range(256)) * 100
+    channel = Channel(1)
+    channel.publisher_confirms_active = True
+    for exchange, routing_key in targets:
+        channel.basic_publish(body, exchange, routing_key)
+    expected = channel.data_to_send()
+
+    channel.basic_publish_multi(body, targets)
+    segments = channel.segments_to_send()
+    assert b''.join(segments) == expected
+    body_segments = [
+        segment for segment in segments if isinstance(segment, memoryview)
+    ]
+    assert all(segment.obj is body for segment in body_segments)
+    assert len(channel._unconfirmed_messages) == 6
+    assert channel._next_delivery_tag == 7
+
+
+def test_publisher_confirms():
+    channel = Channel(1)
+    channel.publisher_confirms_active = True
+    for idx in range(1, 9):
+        channel.basic_publish(b'%d' % idx, routing_key='queue')
+
+    def unconfirmed():
+        return [
+            content.body for content in channel._unconfirmed_messages
+            if content is not None
+        ]
+
+    channel._handle_basic_ack(methods.BasicAck(2, False))
+    assert unconfirmed() == [b'1', b'3', b'4', b'5', b'6', b'7', b'8']
+    channel._handle_basic_ack(methods.BasicAck(1, False))
+    assert channel._first_unconfirmed_tag == 3
+    channel._handle_basic_nack(methods.BasicNack(4, False, False))
+    channel._handle_basic_ack(methods.BasicAck(5, True))
+    assert unconfirmed() == [b'6', b'7', b'8']
+    assert channel._first_unconfirmed_tag == 6
+    channel._handle_basic_nack(methods.BasicNack(7, True, False))
+    assert [content.body for content in channel._nacked_messages] == [
+        b'4', b'6', b'7',
+    ]
+    channel._handle_basic_ack(methods.BasicAck(0, True))
+    assert unconfirmed() == []
+    assert channel._first_unconfirmed_tag == channel._next_delivery_tag == 9
+
+
+def test_ack_batching():
+    channel = Channel(1, ack_batch_size=4)
+
+    def sent(*acks):
+        return b''.join(
+            dump_frame_method(1, method, None) for method in acks
+        )
+
+    for tag in (2, 1, 3):
+        channel.basic_ack(tag)
+    assert channel.data_to_send() == b''
+    channel.basic_ack(4)
+    assert channel.data_to_send() == sent(methods.BasicAck(4, True))
+
+    # 5 is still being handled.
+    channel.basic_ack(7)
+    channel.basic_ack(6)
+    channel.flush_acks()
+    assert channel.data_to_send() == sent(
+        methods.BasicAck(6, False), methods.BasicAck(7, False),
+    )
+    channel.basic_ack(8)
+    channel.basic_ack(5)
+    channel.flush_acks()
+    assert channel.data_to_send() == sent(methods.BasicAck(8, True))
+
+    channel.basic_ack(10)
+    channel.basic_reject(9)
+    assert channel.data_to_send() == sent(
+        methods.BasicAck(10, False), methods.BasicReject(9, False),
+    )
+    channel.basic_ack(12)
+    channel.basic_ack(11)
+    channel.basic_nack(13, multiple=True)
+    assert channel.data_to_send() == sent(
+        methods.BasicAck(12, True), methods.BasicNack(13, True, False),
+    )
+    channel.basic_ack(14)
+    channel._channel_close(200, 'OK', 0, 0)
+    assert channel.data_to_send() == sent(
+        methods.BasicAck(14, False), methods.ChannelClose(200, 'OK', 0, 0),
+    )
+
+
+def sent_methods(channel):
+    connection = Connection()
+    connection.get_channel(channel.channel_id)
+    return connection.parse_data(channel.data_to_send())[channel.channel_id]
+
+
+@pytest.mark.parametrize('gaps', [{1}, {1, 3}])
+def test_ack_batching_permanent_gap(gaps):
+    channel = Channel(1, ack_batch_size=4)
+    channel.max_settled_tags = 8
+    for tag in range(1, 1001):
+        if tag not in gaps:
+            channel.basic_ack(tag)
+        assert len(channel._settled_tags) <= 12
+    channel.flush_acks()
+    acked = [method.delivery_tag for method in sent_methods(channel)]
+    assert sorted(acked) == sorted(set(range(1, 1001)) - gaps)
+
+    # Once the first gap is filled, the acks after it are batched again.
+    channel.basic_ack(1)
+    for tag in (1001, 1002):
+        channel.basic_ack(tag)
+    channel.flush_acks()
+    received = sent_methods(channel)
+    if gaps == {1}:
+        assert received == [methods.BasicAck(1002, True)]
+    else:
+        assert [method.multiple for method in received] == [False] * 3
@@ -0,0 +1,156 @@
+import pytest
+
+from amqproto import methods
+from amqproto.content import BasicContent, BasicProperties
+from amqproto.connection import Connection
+from amqproto.serialization import dump_frame_method, dump_frame_content
+
+
+def deliver_frames(delivery_tag, body, frame_max=4096):
+    method = methods.BasicDeliver('ctag', delivery_tag, False, '', 'queue')
+    content = BasicContent(body, properties=BasicProperties(
+        content_type='text/plain',
+    ))
+    return (
+        dump_frame_method(1, method) +
+        dump_frame_content(1, content, frame_max - 8)
+    )
+
+
+@pytest.fixture
+def connection():
+    connection = Connection()
+    connection.get_channel(1)
+    return connection
+
+
+def test_parse_data_whole_frames(connection):
+    data = deliver_frames(1, b'foo') + deliver_frames(2, b'bar')
+    received = connection.parse_data(data)
+    assert list(received) == [1]
+    assert [method.delivery_tag for method in received[1]] == [1, 2]
+    assert [method.content.body for method in received[1]] == [b'foo', b'bar']
+    assert received[1][0].content.properties.content_type == 'text/plain'
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100])
+def test_parse_data_split_frames(connection, chunk_size):
+    body = bytes(range(256)) * 50
+    data = deliver_frames(1, body, frame_max=1024)
+    received = []
+    for idx in range(0, len(data), chunk_size):
+        received.extend(
+            connection.parse_data(data[idx:idx + chunk_size]).get(1, [])
+        )
+    assert len(received) == 1
+    assert received[0].content.body == body
+    assert connection.bytes_needed == 0
+
+
+def test_bytes_needed(connection):
+    data = deliver_frames(1, b'x' * 1000)
+    method_frame_size = len(dump_frame_method(
+        1, methods.BasicDeliver('ctag', 1, False, '', 'queue'),
+    ))
+    assert connection.bytes_needed == 0
+    connection.parse_data(data[:3])
+    assert connection.bytes_needed == 5
+    connection.parse_data(data[3:10])
+    assert connection.bytes_needed == method_frame_size - 10
+    connection.parse_data(data[10:-100])
+    assert connection.bytes_needed == 100
+    received = connection.parse_data(data[-100:])
+    assert received[1][0].content.body == b'x' * 1000
+    assert connection.bytes_needed == 0
+
+
+@pytest.mark.parametrize('body_type', [bytes, bytearray, memoryview])
+@pytest.mark.parametrize('body_size', [0, 100, 5000])
+def test_body_type(body_type, body_size):
+    connection = Connection(body_type=body_type)
+    connection.get_channel(1)
+    body = bytes(range(100)) * (body_size // 100)
+    received = connection.parse_data(deliver_frames(1, body, frame_max=1024))
+    content = received[1][0].content
+    assert isinstance(content.body, body_type)
+    assert content.body == body
+    assert content.complete()
+
+
+@pytest.mark.parametrize('chunk_size', [3, 1000, 100000])
+def test_get_buffer(chunk_size):
+    connection = Connection(body_type=memoryview)
+    connection.get_channel(1)
+    bodies = [bytes([idx]) * 3000 for idx in range(30)]
+    data = b''.join(
+        deliver_frames(idx, body) for idx, body in enumerate(bodies)
+    )
+    received = []
+    while data:
+        buffer = connection.get_buffer(chunk_size)
+        nbytes = min(chunk_size, len(buffer), len(data))
+        buffer[:nbytes] = data[:nbytes]
+        data = data[nbytes:]
+        received.extend(connection.buffer_updated(nbytes).get(1, []))
+    assert connection.bytes_needed == 0
+    # Bodies received earlier are not overwritten by later reads.
+    assert [method.content.body for method in received] == bodies
+
+
+def test_iter_events(connection):
+    channel2 = connection.get_channel(2)
+    data = (
+        deliver_frames(1, b'foo') +
+        dump_frame_method(2, methods.ChannelFlowOK(True)) +
+        deliver_frames(2, b'bar')
+    )
+    events = connection.iter_events(data[:-1])
+    channel, method = next(events)
+    assert channel is connection.channels[1]
+    assert method.content.body == b'foo'
+    assert [(channel, method.__class__) for channel, method in events] == [
+        (channel2, methods.ChannelFlowOK),
+    ]
+    assert connection.bytes_needed == 1
+    [(channel, method)] = connection.iter_events(data[-1:])
+    assert method.content.body == b'bar'
+
+
+def test_iter_events_closed_early(connection):
+    data = b''.join(deliver_frames(idx, b'body') for idx in range(5))
+    events = connection.iter_events(data)
+    assert next(events)[1].delivery_tag == 0
+    events.close()
+    assert connection.bytes_needed == 0
+    assert [
+        method.delivery_tag for channel, method in connection.iter_events()
+    ] == [1, 2, 3, 4]
+
+
+def test_iter_events_never_iterated(connection):
+    connection.iter_events(deliver_frames(1, b'foo'))
+    connection.iter_events(deliver_frames(2, b'bar')).close()
+    assert [
+        method.content.body for channel, method in connection.iter_events()
+    ] == [b'foo', b'bar']
+
+
+@pytest.mark.parametrize('budget, calls', [
+    ({}, 1),
+    # Every delivery is three frames: method, content header and body.
+    ({'parse_max_frames': 4}, 4),
+    ({'parse_max_bytes': 1}, 14),
+])
+def test_parse_budget(budget, calls):
+    connection = Connection(**budget)
+    connection.get_channel(1)
+    data = b''.join(deliver_frames(idx, b'body') for idx in range(5))
+    received = connection.parse_data(data[:-1])[1]
+    parsed = 1
+    while connection.parse_pending:
+        received.extend(connection.parse_data(b'')[1])
+        parsed += 1
+    assert parsed == calls
+    assert connection.bytes_needed == 1
+    received.extend(connection.parse_data(data[-1:])[1])
+    assert [method.delivery_tag for method in received] == [0, 1, 2, 3, 4]
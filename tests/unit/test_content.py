@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import attr
+import pytest
+
+from amqproto.content import Properties, BasicProperties
+
+
+@pytest.fixture
+def many_properties():
+    """Properties that require a continuation flags word."""
+    properties = Properties.register(spec='B' * 17, class_id=0xffff)(
+        attr.make_class(
+            'ManyProperties',
+            {'p%d' % idx: attr.ib(None) for idx in range(17)},
+            bases=(Properties,), slots=True,
+        )
+    )
+    yield properties
+    del Properties.BY_ID[properties.class_id]
+
+
+@pytest.mark.parametrize('properties', [
+    BasicProperties(),
+    BasicProperties(content_type='text/plain'),
+    BasicProperties(app_id='app'),
+    BasicProperties(
+        content_type='application/json', content_encoding='gzip',
+        headers={'foo': 'bar'}, delivery_mode=2, priority=5,
+        correlation_id='id', reply_to='queue', expiration='1000',
+        message_id='id', timestamp=datetime(1994, 1, 16), type='type',
+        user_id='guest', app_id='app',
+    ),
+])
+def test_roundtrip(properties):
+    data = properties.dump()
+    assert BasicProperties.load(data) == properties
+    # Now from the cached decoder and encoder.
+    assert properties.dump() == data
+    assert BasicProperties.load(data) == properties
+
+
+def test_flags():
+    assert BasicProperties().dump() == b'\x00\x00'
+    assert BasicProperties(delivery_mode=2).dump() == b'\x10\x00\x02'
+
+
+def test_deprecated_properties():
+    data = b'\x00\x04\x03foo'
+    properties = BasicProperties.load(data)
+    assert properties.cluster_id == 'foo'
+    assert properties.dump() == data
+
+
+@pytest.mark.parametrize('values,data', [
+    ({}, b'\x00\x00'),
+    ({'p0': 1}, b'\x80\x00\x01'),
+    ({'p14': 1}, b'\x00\x02\x01'),
+    ({'p15': 1}, b'\x00\x01\x80\x00\x01'),
+    ({'p0': 1, 'p16': 2}, b'\x80\x01\x40\x00\x01\x02'),
+])
+def test_continuation_flags(many_properties, values, data):
+    properties = many_properties(**values)
+    assert properties.dump() == data
+    assert many_properties.load(data) == properties
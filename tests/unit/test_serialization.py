@@ -1,15 +1,19 @@
 from io import BytesIO
 from struct import error
+from decimal import Decimal
 from datetime import datetime
 
 import pytest
 
 from amqproto import methods
+from amqproto.content import BasicProperties
 from amqproto.serialization import (
     FrameType,
     parse_protocol_header, dump_protocol_header,
-    parse_frames, dump_frame_method, dump_frame_content, dump_frame_heartbeat,
-    load, dump, IncompleteData,
+    parse_frames, parse_frame, scan_frame,
+    dump_frame_method, dump_frame_content, dump_frame_heartbeat,
+    load, dump, Codec, LazyTable, PreparedTable, TableCache,
+    IncompleteData,
 )
 
 
@@ -69,6 +73,34 @@ class TestFrameMethod:
         )
 
 
+class TestParseFrame:
+
+    def test_parse_body_without_copying(self):
+        data = dump_frame_heartbeat(0) + b'\x03\x00\x01\x00\x00\x00\x03foo\xce'
+        view = memoryview(data)
+        frame, offset = parse_frame(view)
+        assert frame == (0, FrameType.HEARTBEAT, None)
+        frame, offset = parse_frame(view, offset)
+        channel_id, frame_type, payload = frame
+        assert (channel_id, frame_type) == (1, FrameType.CONTENT_BODY)
+        assert isinstance(payload, memoryview)
+        assert payload.obj is data
+        assert payload == b'foo'
+        assert offset == len(data)
+
+    @pytest.mark.parametrize('data', [
+        b'', b'\x03\x00\x01', b'\x03\x00\x01\x00\x00\x00\x03fo',
+        b'\x03\x00\x01\x00\x00\x00\x03foo',
+    ])
+    def test_parse_incomplete(self, data):
+        with pytest.raises(IncompleteData):
+            parse_frame(memoryview(data))
+
+    def test_parse_wrong_frame_end(self):
+        with pytest.raises(error):
+            parse_frame(memoryview(b'\x03\x00\x01\x00\x00\x00\x03foo\x00'))
+
+
 @pytest.mark.parametrize('fmt,data,expected', [
     # bool
     ('?', b'\x00', [False]),
@@ -220,3 +252,154 @@ def test_dump(fmt, values, expected):
     else:
         result = dump(fmt, *values)
         assert result == expected
+
+
+@pytest.mark.parametrize('fmt,values', [
+    ('', []),
+    ('?', [True]),
+    ('????????????', [True, False] * 6),
+    ('B?H', [1, True, 2]),
+    ('?B?', [True, 1, True]),
+    ('Q?ssL', [1, True, 'exchange', 'routing.key', 0xffffffff]),
+    ('sSt', ['Омск', 'foo', datetime(1994, 1, 16)]),
+    ('T', [{'int': -5, 'big': 2 ** 40, 'float': 0.5, 'none': None,
+            'list': [1, 'foo', False], 'table': {'foo': b'bar'},
+            'date': datetime(1994, 1, 16)}]),
+    ('?BHtSTssQL', [False, 0, 0, datetime(1970, 1, 1), '', {}, '', '', 0, 0]),
+])
+def test_codec_matches_interpreter(fmt, values):
+    codec = Codec(fmt)
+    data = codec.dump(*values)
+    assert data == dump(fmt, *values)
+    assert codec.load(data) == (values, len(data))
+    assert codec.load(memoryview(b'\x00' + data), 1) == (values, len(data) + 1)
+    assert load(fmt, BytesIO(data)) == values
+
+
+@pytest.mark.parametrize('fmt,data', [
+    ('s', b''),
+    ('s', b'\x04bar'),
+    ('S', b'\x00\x00\x00\x04bar'),
+    ('HL', b'\x00\x00\x00'),
+    ('T', b'\x00\x00\x00\x11\x03foo'),
+])
+def test_codec_load_not_enough_data(fmt, data):
+    with pytest.raises(error):
+        Codec(fmt).load(data)
+
+
+@pytest.mark.parametrize('method_cls', list(methods.Method.BY_ID.values()))
+def test_method_roundtrip(method_cls):
+    defaults = {'?': True, 'B': 1, 'H': 2, 'L': 3, 'Q': 4, 's': 'short',
+                'S': 'long', 't': datetime(1994, 1, 16), 'T': {'foo': 1}}
+    method = method_cls(*[defaults[char] for char in method_cls.spec])
+    assert methods.Method.load(method.dump()) == method
+
+
+@pytest.mark.parametrize('data,needed', [
+    (b'', 8),
+    (b'\x03\x00\x01', 5),
+    (b'\x03\x00\x01\x00\x00\x00\x03', 4),
+    (b'\x03\x00\x01\x00\x00\x00\x03fo', 2),
+    (b'\x03\x00\x01\x00\x00\x00\x03foo\xce', 0),
+    (b'\x03\x00\x01\x00\x00\x00\x03foo\xce\x08', 0),
+])
+def test_scan_frame(data, needed):
+    assert scan_frame(memoryview(data)) == needed
+
+
+class TestLazyTable:
+
+    table = {'int': -5, 'str': 'foo', 'decimal': Decimal('1.5'),
+             'list': [1, 'foo', None], 'table': {'foo': b'bar'},
+             'date': datetime(1994, 1, 16), 'none': None, 'float': 0.5}
+
+    def test_load(self):
+        data = dump('T', self.table)
+        codec = Codec('T', lazy_tables=True)
+        (table,), offset = codec.load(data)
+        assert offset == len(data)
+        assert isinstance(table, LazyTable)
+        assert table['str'] == 'foo'
+        assert list(table._values) == ['str']
+        assert table == self.table
+        assert list(table) == list(self.table)
+        assert 'missing' not in table
+        with pytest.raises(KeyError):
+            table['missing']
+
+    def test_dump_reuses_encoded_table(self):
+        data = dump('T', self.table)
+        (table,), _ = Codec('T', lazy_tables=True).load(data)
+        assert Codec('T').dump(table) == data
+        assert dump('T', {'nested': table}) == dump('T', {
+            'nested': self.table,
+        })
+
+    def test_method_and_properties(self):
+        method = methods.BasicConsume(
+            0, 'queue', 'ctag', False, False, False, False, self.table,
+        )
+        loaded = methods.Method.load(method.dump(), lazy_tables=True)
+        assert isinstance(loaded.arguments, LazyTable)
+        assert loaded == method
+
+        properties = BasicProperties(headers=self.table, priority=1)
+        loaded = BasicProperties.load(properties.dump(), lazy_tables=True)
+        assert isinstance(loaded.headers, LazyTable)
+        assert loaded == properties
+
+
+class TestTableCache:
+
+    def test_hits_and_misses(self):
+        cache = TableCache(maxsize=2)
+        codec = Codec('sT')
+        table = {'foo': 1, 'bar': 'baz'}
+        data = codec.dump('queue', table)
+        assert codec.dump('queue', table, table_cache=cache) == data
+        assert codec.dump('queue', dict(table), table_cache=cache) == data
+        assert (cache.hits, cache.misses) == (1, 1)
+        # Equal values of different types are encoded differently.
+        codec.dump('queue', {'foo': True, 'bar': 'baz'}, table_cache=cache)
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_bounded(self):
+        cache = TableCache(maxsize=2)
+        for idx in range(3):
+            cache.dump({'foo': idx})
+        cache.dump({'foo': 0})
+        assert (cache.hits, cache.misses) == (0, 4)
+        cache.dump({'foo': 0})
+        assert (cache.hits, cache.misses) == (1, 4)
+
+    def test_unhashable_values(self):
+        cache = TableCache()
+        table = {'foo': [1, 2], 'bar': {'baz': 1}}
+        assert cache.dump(table) == dump('T', table)
+        assert cache.dump(table) == dump('T', table)
+        assert (cache.hits, cache.misses) == (0, 2)
+
+    @pytest.mark.parametrize('first,second', [
+        ((1,), (True,)),
+        (Decimal('1.0'), Decimal('1.00')),
+        (0.0, -0.0),
+    ])
+    def test_equal_values_encoded_differently(self, first, second):
+        cache = TableCache()
+        assert cache.dump({'foo': first}) == dump('T', {'foo': first})
+        assert cache.dump({'foo': second}) == dump('T', {'foo': second})
+        assert cache.hits == 0
+
+    def test_prepared_table(self):
+        table = PreparedTable({'foo': 1})
+        assert table == {'foo': 1}
+        # Equal to tables encoded differently, so it can't be hashable.
+        assert table == PreparedTable({'foo': True})
+        with pytest.raises(TypeError):
+            hash(table)
+        assert dump('T', table) == dump('T', {'foo': 1})
+        method = methods.QueueDeclare(
+            0, 'queue', False, False, False, False, False, table,
+        )
+        assert methods.Method.load(method.dump()) == method